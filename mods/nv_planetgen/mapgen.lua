@@ -43,12 +43,30 @@ local function planet_from_mapping(mapping)
     return planet
 end
 
+-- Attributes that profiling results can be grouped by, see 'perf/README.md';
+-- this does nothing unless the mod is being profiled
+local function profile_tag_chunk(minp, maxp, mapping, planet)
+    profile_tag("x", minp.x)
+    profile_tag("y", minp.y)
+    profile_tag("z", minp.z)
+    profile_tag("nodes", (maxp.x - minp.x + 1) * (maxp.y - minp.y + 1) * (maxp.z - minp.z + 1))
+    profile_tag("walled", mapping.walled and true or false)
+    profile_tag("seed", planet.seed)
+    profile_tag("atmosphere", planet.atmosphere)
+    profile_tag("life", planet.life)
+    profile_tag("oceans", planet.has_oceans)
+    profile_tag("caveness", planet.caveness)
+    profile_tag("rockiness", planet.rockiness)
+    profile_tag("terrestriality", planet.terrestriality)
+end
+
 function nv_planetgen.generate_planet_chunk(minp, maxp, area, A, A1, A2, mapping)
     local max = math.max
     local min = math.min
 
     nv_planetgen.set_dirty_flag()
     local planet = planet_from_mapping(mapping)
+    profile_tag_chunk(minp, maxp, mapping, planet)
     local offset = mapping.offset
     local ground_buffer = nv_planetgen.pass_elevation(
         minp, maxp, area, offset, A, planet
@@ -6,18 +6,99 @@
 #   NAME    Name of the profiled function
 #   COUNT   Number of calls made to this function during profiling
 #   AVERAGE Average time spent inside the function on each call
-#   TOTAL   Total time spent inside the function
-#   ...     Log chart of TOTAL
+#   TOTAL   Total time spent inside the function, including other profiled
+#           functions it calls
+#   SELF    Time spent inside the function itself, excluding other profiled
+#           functions it calls
+#   ...     Log chart of the column the table is sorted by (SELF by default)
 
 # In order to record and display performance data, run (from the mod top-level
 # directory): 'minetest 2>&1 | python3 perf/analyze.py', and then play a game
 # with the profiling-enabled mod.
 
-import sys, re, math
+# With '--tree', it prints the tree of profiled calls instead, merging calls
+# made from the same path; with '--folded', it prints the self time of each
+# path as folded stacks, which flame graph tools such as 'flamegraph.pl' or
+# speedscope can read, e.g. 'python3 perf/analyze.py --folded < log > stacks'.
 
-re_line = re.compile(r"([a-zA-Z0-9_.]+) (\d+)")
+# With '--percentiles', it prints the distribution of call times of each
+# function instead: its minimum, median (P50), 90th, 99th and 99.9th
+# percentiles, and maximum; with '--histogram NAME...', it prints a histogram
+# of the call times of the given functions.
 
-data = {}
+# With '--live SECONDS', it also redraws a table every few seconds while events
+# arrive, with the number of calls per second and average time of each
+# function over the last 10 and 60 seconds, as well as since the start; the
+# final summary is printed when the game exits or on Ctrl-C.
+
+# With '--save FILE', the data read is also saved as JSON, along with the git
+# commit of the mod, the duration of the run, and the world seed and a label if
+# given with '--seed' and '--label'; '--load FILE' reads a saved run instead of
+# events, for any of the above views. '--compare BEFORE AFTER...' lines up the
+# functions of saved runs and prints the change in their average, self,
+# median (P50) and 99th percentile (P99) time per call, and total time, from
+# the first run to each of the others; changes in average time larger than
+# '--threshold', and than its 95% confidence interval, are flagged.
+
+# Calls given attributes with 'profile_tag()', e.g. each chunk generated by
+# 'generate_planet_chunk' with its position and planet, are also recorded.
+# '--by ATTRIBUTE' prints their number, average and total time, and the
+# functions taking most of it, for each value of the attribute, e.g. '--by seed'
+# for each planet; numbers with a fraction are grouped in ranges. '--chunk-map'
+# prints a map of the time spent on the chunks in each column of the world, and
+# the slowest chunks.
+
+# With '--memory', it prints the memory allocated by each function instead, per
+# call, in total and excluding other profiled functions it calls, with the
+# share of all allocation made by the function itself, as an estimate of its
+# share of the garbage collector's work, and the memory freed during its calls;
+# this needs the 'nv_planetgen_profile_memory' setting to be enabled in the game.
+
+# With '--trace FILE', events are also written to FILE as a trace in the Chrome
+# trace event format, which Perfetto (https://ui.perfetto.dev) and
+# 'chrome://tracing' can show as a timeline, with one track for each
+# environment, i.e. the main thread and each emerge thread; instead of the
+# table, it prints how much of the time each environment was busy, and for how
+# long several of them were busy at once.
+
+import argparse, collections, json, os, select, shutil, subprocess, sys, re, math, time
+
+# Each event is the function name, its time in microseconds, the number of
+# profiled calls it was nested in, the number of calls it stands for if
+# sampled, when it started in microseconds, and the ID of the environment it
+# ran in, followed, if memory is profiled, by the bytes allocated and freed
+# during the call. Older logs lack some of the fields at the end; without the
+# depth, calls are all treated as top-level
+re_line = re.compile(r"([a-zA-Z0-9_.:]+) (\d+)(?: (\d+))?(?: (\d+))?(?: (\d+) (\S+))?(?: (\d+) (\d+))?")
+# Summaries printed when calls are added up in the game have the chain of calls
+# leading to a function, then the count, total, self, minimum and maximum time
+# of its calls, their histogram as comma-separated 'bucket:count' pairs, and,
+# if memory is profiled, the bytes allocated by them, by them excluding
+# profiled calls inside, and freed during them
+re_summary = re.compile(r"profile_summary ([a-zA-Z0-9_.:;]+) (\d+) (\d+) (-?\d+) (\d+) (\d+) ?([-0-9:,]*)(?: (\d+) (-?\d+) (\d+))?")
+# Functions whose calls are only counted print their number of calls
+re_count = re.compile(r"profile_count ([a-zA-Z0-9_.:]+) (\d+)")
+# Calls with attributes print their name, time, attributes as 'key=value' pairs
+# separated by ';', and the count, total and self time of each function called
+# inside them as comma-separated 'name:count:total:self' entries
+re_tag = re.compile(r"profile_tag ([a-zA-Z0-9_.:]+) (\d+) (\S*) ?(\S*)")
+
+# Call times are counted in a histogram with 'buckets_per_octave' buckets for
+# each power of 2, so percentiles can be estimated to within about 4% using a
+# bounded amount of memory. Bucket n holds times t such that
+# floor(log2(t) * buckets_per_octave) == n, and bucket -1 holds times of 0
+buckets_per_octave = 8
+
+def bucket_index(time):
+    if time < 1:
+        return -1
+    return math.floor(math.log2(time) * buckets_per_octave)
+
+# Returns the range of times that fall into a bucket
+def bucket_bounds(index):
+    if index < 0:
+        return 0, 1
+    return 2 ** (index / buckets_per_octave), 2 ** ((index + 1) / buckets_per_octave)
 
 def time_format(n):
     r = None
@@ -29,22 +110,753 @@ def time_format(n):
         r = "{:.2f} us".format(n)
     return r
 
-for line in sys.stdin:
+def new_profile():
+    return {
+        # Statistics of all finished top-level calls, by call path
+        "paths": {},
+        # Calls whose caller hasn't finished yet, by environment and depth, as
+        # their statistics by call path and the sums of their times and of the
+        # memory they allocated
+        "pending": {},
+        # Distribution of call times of each function, as a dictionary with
+        # its call count, total time, minimum, maximum and histogram, by
+        # function name
+        "distributions": {},
+        # Number of calls to each function whose calls are only counted
+        "counts": {},
+        # Calls with attributes, as dictionaries with their name, time,
+        # attributes, and the count, total and self time of the functions
+        # called inside them, by name
+        "records": [],
+        # Events with their start time, as (name, start, time, depth,
+        # environment) tuples, if kept for a trace
+        "events": None,
+    }
+
+def add_distribution(distributions, name, count, total, minimum, maximum, buckets):
+    if name not in distributions:
+        distributions[name] = {
+            "count" : 0,
+            "total" : 0,
+            "min" : minimum,
+            "max" : maximum,
+            "buckets" : {},
+        }
+    distribution = distributions[name]
+    distribution["count"] += count
+    distribution["total"] += total
+    distribution["min"] = min(distribution["min"], minimum)
+    distribution["max"] = max(distribution["max"], maximum)
+    for index, bucket_count in buckets.items():
+        distribution["buckets"][index] = distribution["buckets"].get(index, 0) + bucket_count
+
+# Estimates the time below which a fraction 'q' of calls fall, from the
+# histogram; times within a bucket are assumed to be spread logarithmically
+def percentile(distribution, q):
+    rank = q * distribution["count"]
+    seen = 0
+    for index in sorted(distribution["buckets"]):
+        count = distribution["buckets"][index]
+        if seen + count >= rank:
+            low, high = bucket_bounds(index)
+            if index >= 0:
+                low = low * (high / low) ** ((rank - seen) / count)
+            return min(max(low, distribution["min"]), distribution["max"])
+        seen += count
+    return distribution["max"]
+
+def add_path_stats(paths, path, count, total, self_time, alloc=0, self_alloc=0, freed=0):
+    if path not in paths:
+        paths[path] = {
+            "count" : 0,
+            "total" : 0,
+            "self" : 0,
+            "alloc" : 0,
+            "self_alloc" : 0,
+            "freed" : 0,
+        }
+    paths[path]["count"] += count
+    paths[path]["total"] += total
+    paths[path]["self"] += self_time
+    paths[path]["alloc"] += alloc
+    paths[path]["self_alloc"] += self_alloc
+    paths[path]["freed"] += freed
+
+# Adds a call to a profile. Calls are received as they finish, so all calls
+# nested in it, at the next depth, have already been received. A sampled call
+# stands for 'weight' calls; calls nested in it are only those made by it. Calls
+# skipped by sampling have a weight of 0, and only hold the calls made by them.
+# Calls from different environments, which run in different threads, nest
+# separately
+def add_call(profile, name, time, depth, weight=1, environment=None, alloc=0, freed=0):
+    pending = profile["pending"].setdefault(environment, {})
+    children, children_time, children_alloc = pending.pop(depth + 1, ({}, 0, 0))
+    if depth == 0:
+        paths = profile["paths"]
+    else:
+        if depth not in pending:
+            pending[depth] = ({}, 0, 0)
+        paths, siblings_time, siblings_alloc = pending[depth]
+        pending[depth] = (paths, siblings_time + time * weight, siblings_alloc + alloc * weight)
+    add_path_stats(paths, (name,), weight, time * weight, (time - children_time) * weight,
+        alloc * weight, (alloc - children_alloc) * weight, freed * weight)
+    if weight > 0:
+        add_distribution(profile["distributions"], name, weight, time * weight, time, time,
+            {bucket_index(time): weight})
+    for path, stats in children.items():
+        add_path_stats(paths, (name,) + path, stats["count"], stats["total"], stats["self"],
+            stats["alloc"], stats["self_alloc"], stats["freed"])
+
+# Adds a summary of calls made from the same chain of calls. Calls made inside
+# calls skipped by sampling can have a chain with no summary of its own, which
+# is then added without calls, so the call tree stays connected
+def add_summary(profile, path, count, total, self_time, minimum, maximum, buckets, alloc=0,
+        self_alloc=0, freed=0):
+    for n in range(1, len(path)):
+        if path[:n] not in profile["paths"]:
+            add_path_stats(profile["paths"], path[:n], 0, 0, 0)
+    add_path_stats(profile["paths"], path, count, total, self_time, alloc, self_alloc, freed)
+    add_distribution(profile["distributions"], path[-1], count, total, minimum, maximum, buckets)
+
+# Adds an event, summary or record to a profile; returns the name of the
+# function, the number of calls and their total time, or None if the line holds
+# no calls
+def parse_line(profile, line):
+    match = re_tag.match(line)
+    if match is not None:
+        functions = {}
+        for entry in filter(None, match.group(4).split(",")):
+            name, count, total, self_time = entry.rsplit(":", 3)
+            functions[name] = [int(count), int(total), int(self_time)]
+        profile["records"].append({
+            "name": match.group(1),
+            "time": int(match.group(2)),
+            "tags": dict(pair.split("=", 1) for pair in filter(None, match.group(3).split(";"))),
+            "functions": functions,
+        })
+        return None
+    match = re_summary.match(line)
+    if match is not None:
+        path = tuple(match.group(1).split(";"))
+        count, total, self_time, minimum, maximum = map(int, match.group(2, 3, 4, 5, 6))
+        buckets = {}
+        for pair in filter(None, match.group(7).split(",")):
+            index, bucket_count = pair.split(":")
+            buckets[int(index)] = buckets.get(int(index), 0) + int(bucket_count)
+        memory = [int(n) for n in match.group(8, 9, 10) if n is not None]
+        add_summary(profile, path, count, total, self_time, minimum, maximum, buckets, *memory)
+        return path[-1], count, total
+    match = re_count.match(line)
+    if match is not None:
+        name, count = match.group(1), int(match.group(2))
+        profile["counts"][name] = profile["counts"].get(name, 0) + count
+        return name, count, 0
     match = re_line.match(line)
     if match is not None:
-        name = match.group(1)
-        time = int(match.group(2))
+        name, time = match.group(1), int(match.group(2))
+        depth = int(match.group(3)) if match.group(3) is not None else 0
+        weight = int(match.group(4)) if match.group(4) is not None else 1
+        environment = match.group(6)
+        memory = [int(n) for n in match.group(7, 8) if n is not None]
+        add_call(profile, name, time, depth, weight, environment, *memory)
+        if profile["events"] is not None and match.group(5) is not None and weight > 0:
+            profile["events"].append((name, int(match.group(5)), time, depth, environment))
+        return name, weight, time * weight
+    return None
+
+# Treats calls that never got a caller, e.g. because the game exited in the
+# middle of it, as top-level calls
+def finish_profile(profile):
+    for pending in profile["pending"].values():
+        for depth, (paths, time, alloc) in pending.items():
+            for path, stats in paths.items():
+                add_path_stats(profile["paths"], path, stats["count"], stats["total"],
+                    stats["self"], stats["alloc"], stats["self_alloc"], stats["freed"])
+    profile["pending"] = {}
+    limit_estimates(profile)
+
+# Each sampled call stands for many calls, so a single slow one can make the
+# estimated total of a function larger than the time of the calls it was made
+# from, and the self time of those, which subtracts it, negative. The total of
+# each chain is limited to that of its caller, if it was timed, and self times
+# are worked out again from the totals of the chains below, no lower than 0
+def limit_estimates(profile):
+    paths = profile["paths"]
+    children_total = {}
+    for path in sorted(paths, key=len):
+        stats = paths[path]
+        caller = paths.get(path[:-1])
+        if caller is not None and caller["count"] > 0:
+            stats["total"] = min(stats["total"], caller["total"])
+        if len(path) > 1:
+            children_total[path[:-1]] = children_total.get(path[:-1], 0) + stats["total"]
+    for path, stats in paths.items():
+        stats["self"] = max(stats["total"] - children_total.get(path, 0), 0)
+
+# Returns the statistics of each function, adding up all paths it's called
+# from; time spent and memory allocated in recursive calls are only counted once
+# in the total. Runs saved before memory was profiled have no memory statistics
+def function_stats(profile):
+    data = {}
+    for path, stats in profile["paths"].items():
+        name = path[-1]
         if name not in data:
             data[name] = {
                 "count" : 0,
                 "total" : 0,
+                "self" : 0,
+                "alloc" : 0,
+                "self_alloc" : 0,
+                "freed" : 0,
             }
-        data[name]["count"] += 1
-        data[name]["total"] += time
-print("NAME" + (48-4)*" " + "COUNT" + (12-5)*" " +\
-"AVERAGE" + (12-7)*" " + "TOTAL" + (12-5)*" " + "...")
-data = sorted(data.items(), key=lambda x: x[1]["total"], reverse=True)
-for name, stats in data:
-    print("{:<48s}{:<12d}{:<12s}{:<12s}{:s}".format(name, stats["count"],\
-    time_format(stats["total"]/stats["count"]), time_format(stats["total"]),
-    math.floor(math.log2(stats["total"]))*"#"))
+        data[name]["count"] += stats["count"]
+        data[name]["self"] += stats["self"]
+        data[name]["self_alloc"] += stats.get("self_alloc", 0)
+        data[name]["freed"] += stats.get("freed", 0)
+        if name not in path[:-1]:
+            data[name]["total"] += stats["total"]
+            data[name]["alloc"] += stats.get("alloc", 0)
+    return data
+
+def print_table(profile, sort):
+    print("NAME" + (48-4)*" " + "COUNT" + (12-5)*" " + "AVERAGE" + (12-7)*" " +\
+    "TOTAL" + (12-5)*" " + "SELF" + (12-4)*" " + "...")
+    data = sorted(function_stats(profile).items(), key=lambda x: x[1][sort], reverse=True)
+    # Functions never timed by sampling only hold the calls made inside them
+    for name, stats in filter(lambda x: x[1]["count"] > 0, data):
+        print("{:<48s}{:<12d}{:<12s}{:<12s}{:<12s}{:s}".format(name, stats["count"],\
+        time_format(stats["total"]/stats["count"]), time_format(stats["total"]),
+        time_format(stats["self"]), math.floor(math.log2(max(stats[sort], 1)))*"#"))
+    # Functions whose calls were only counted have no times
+    for name, count in sorted(profile["counts"].items(), key=lambda x: x[1], reverse=True):
+        print("{:<48s}{:<12d}{:<12s}{:<12s}{:s}".format(name, count, "-", "-", "-"))
+
+def bytes_format(n):
+    for unit in ["B", "kB", "MB"]:
+        if abs(n) < 1024:
+            return "{:.2f} {}".format(n, unit)
+        n /= 1024
+    return "{:.2f} GB".format(n)
+
+# Prints the memory allocated by each function, sorted by the memory allocated
+# by the function itself. The incremental garbage collector does its work in
+# steps taken as memory is allocated, so the time it takes is paid by the code
+# that allocates, in proportion to how much it allocates; the share of all
+# allocation made by each function is given as an estimate of its share of that
+# time
+def print_memory(profile):
+    data = function_stats(profile)
+    all_alloc = sum(max(stats["self_alloc"], 0) for stats in data.values())
+    if all_alloc == 0:
+        print("No memory allocation recorded; enable nv_planetgen_profile_memory in the game")
+        return
+    print("NAME" + (48-4)*" " + "COUNT" + (12-5)*" " + "ALLOC/CALL" + (12-10)*" " +\
+    "TOTAL ALLOC" + (12-11)*" " + "SELF ALLOC" + (12-10)*" " + "GC SHARE" + (12-8)*" " + "FREED")
+    data = sorted(data.items(), key=lambda x: x[1]["self_alloc"], reverse=True)
+    for name, stats in filter(lambda x: x[1]["count"] > 0, data):
+        print("{:<48s}{:<12d}{:<12s}{:<12s}{:<12s}{:<12s}{:s}".format(name, stats["count"],
+        bytes_format(stats["alloc"]/stats["count"]), bytes_format(stats["alloc"]),
+        bytes_format(stats["self_alloc"]),
+        "{:.1f}%".format(max(stats["self_alloc"], 0) / all_alloc * 100),
+        bytes_format(stats["freed"])))
+
+# Prints the call tree, with the children of each call sorted by total time
+def print_tree(profile):
+    children = {}
+    for path in profile["paths"]:
+        children.setdefault(path[:-1], []).append(path)
+    print("NAME" + (64-4)*" " + "COUNT" + (12-5)*" " + "AVERAGE" + (12-7)*" " +\
+    "TOTAL" + (12-5)*" " + "SELF")
+    stack = sorted(children.get((), []), key=lambda p: profile["paths"][p]["total"])
+    while len(stack) > 0:
+        path = stack.pop()
+        stats = profile["paths"][path]
+        print("{:<64s}{:<12d}{:<12s}{:<12s}{:s}".format((len(path) - 1)*"  " + path[-1],
+        stats["count"], time_format(stats["total"]/stats["count"]) if stats["count"] > 0 else "-",
+        time_format(stats["total"]), time_format(stats["self"])))
+        stack += sorted(children.get(path, []), key=lambda p: profile["paths"][p]["total"])
+
+percentiles = [("P50", 0.5), ("P90", 0.9), ("P99", 0.99), ("P99.9", 0.999)]
+
+# Prints the distribution of call times of each function, sorted by their
+# 99th percentile
+def print_percentiles(profile):
+    print("NAME" + (48-4)*" " + "COUNT" + (12-5)*" " + "MIN" + (12-3)*" " +\
+    "".join(["{:<12s}".format(label) for label, q in percentiles]) + "MAX")
+    data = sorted(profile["distributions"].items(), key=lambda x: percentile(x[1], 0.99),
+        reverse=True)
+    for name, distribution in data:
+        print("{:<48s}{:<12d}{:<12s}".format(name, distribution["count"],
+        time_format(distribution["min"])) + "".join(["{:<12s}".format(
+        time_format(percentile(distribution, q))) for label, q in percentiles]) +\
+        time_format(distribution["max"]))
+
+# Prints a histogram of the call times of a function, with one row for each
+# power of 2
+def print_histogram(profile, name):
+    if name not in profile["distributions"]:
+        print("No calls to {}".format(name))
+        return
+    distribution = profile["distributions"][name]
+    rows = {}
+    for index, count in distribution["buckets"].items():
+        row = index // buckets_per_octave if index >= 0 else -1
+        rows[row] = rows.get(row, 0) + count
+    print("{} ({} calls, {}, {})".format(name, distribution["count"], ", ".join(
+        ["{} {}".format(label, time_format(percentile(distribution, q)))
+        for label, q in percentiles]), "max " + time_format(distribution["max"])))
+    largest = max(rows.values())
+    for row in range(min(rows), max(rows) + 1):
+        count = rows.get(row, 0)
+        low, high = (0, 1) if row < 0 else (2 ** row, 2 ** (row + 1))
+        print("{:>10s} - {:<10s}{:<12d}{:s}".format(time_format(low), time_format(high), count,
+        math.ceil(count / largest * 50)*"#"))
+    print()
+
+# Returns the mean time of the calls in a distribution, and the standard error
+# of that mean, estimating the spread of call times from the histogram, with the
+# calls in each bucket taken at its logarithmic middle
+def mean_error(distribution):
+    count, mean = distribution["count"], distribution["total"] / distribution["count"]
+    variance = 0
+    for index, bucket_count in distribution["buckets"].items():
+        low, high = bucket_bounds(index)
+        middle = min(max(math.sqrt(low * high) if index >= 0 else 0, distribution["min"]),
+            distribution["max"])
+        variance += bucket_count * (middle - mean) ** 2
+    variance /= max(count - 1, 1)
+    return mean, math.sqrt(variance / count)
+
+def print_folded(profile):
+    for path, stats in sorted(profile["paths"].items()):
+        if stats["self"] > 0:
+            print("{} {}".format(";".join(path), stats["self"]))
+
+# Lengths of the sliding windows shown in live mode, in seconds
+window_lengths = [10, 60]
+
+# Reads lines from a file descriptor as they arrive, in large blocks to keep up
+# with the game; yields lists of complete lines, or an empty list whenever
+# 'timeout' seconds pass without any data, and stops at the end of the input
+def read_blocks(fd, timeout):
+    partial = b""
+    while True:
+        ready, _, _ = select.select([fd], [], [], timeout)
+        if len(ready) == 0:
+            yield []
+            continue
+        data = os.read(fd, 1 << 16)
+        if len(data) == 0:
+            if len(partial) > 0:
+                yield [partial.decode(errors="replace")]
+            return
+        lines = (partial + data).split(b"\n")
+        partial = lines.pop()
+        yield [line.decode(errors="replace") for line in lines]
+
+# Adds up the calls received in each second still inside the longest window;
+# returns the count and total time of each function in each window
+def window_stats(recent, now):
+    data = {}
+    for second, calls in recent:
+        for name, (count, total) in calls.items():
+            if name not in data:
+                data[name] = [[0, 0] for length in window_lengths]
+            for n, length in enumerate(window_lengths):
+                if now - second < length:
+                    data[name][n][0] += count
+                    data[name][n][1] += total
+    return data
+
+def print_live(profile, recent, now, start):
+    columns = ["COUNT", "TOTAL"]
+    for length in window_lengths:
+        columns += ["CALLS/S {}S".format(length), "AVG {}S".format(length)]
+    lines = ["NAME" + (40-4)*" " + "".join(["{:<14s}".format(column) for column in columns])]
+    totals = {name: stats["count"] for name, stats in profile["distributions"].items()}
+    totals.update(profile["counts"])
+    windows = window_stats(recent, now)
+    # Functions taking the most time in the shortest window go first
+    names = sorted(totals, key=lambda name: (windows[name][0][1] if name in windows else 0,
+        totals[name]), reverse=True)
+    for name in names[:max(shutil.get_terminal_size().lines - 3, 1)]:
+        timed = name in profile["distributions"]
+        row = [str(totals[name]), time_format(profile["distributions"][name]["total"]) if timed \
+            else "-"]
+        for n, length in enumerate(window_lengths):
+            count, total = windows[name][n] if name in windows else (0, 0)
+            row += ["{:.1f}".format(count / max(min(length, now - start), 1)),
+                time_format(total / count) if count > 0 and timed else "-"]
+        lines.append("{:<40s}".format(name) + "".join(["{:<14s}".format(cell) for cell in row]))
+    # Move to the top left corner and clear the screen before drawing
+    sys.stdout.write("\x1b[H\x1b[2J" + "\n".join(lines) + "\n")
+    sys.stdout.flush()
+
+# Reads events while redrawing a table every 'interval' seconds, until the end
+# of the input or Ctrl-C
+def run_live(profile, interval):
+    start = time.monotonic()
+    last_draw = start
+    # Calls received in each second, as (second, {name: [count, total]}) pairs
+    recent = collections.deque()
+    try:
+        for lines in read_blocks(sys.stdin.fileno(), interval):
+            now = time.monotonic()
+            second = math.floor(now)
+            if len(recent) == 0 or recent[-1][0] != second:
+                recent.append((second, {}))
+            while now - recent[0][0] >= max(window_lengths):
+                recent.popleft()
+            calls = recent[-1][1]
+            for line in lines:
+                result = parse_line(profile, line)
+                if result is not None:
+                    name, count, total = result
+                    if name not in calls:
+                        calls[name] = [0, 0]
+                    calls[name][0] += count
+                    calls[name][1] += total
+            if now - last_draw >= interval:
+                print_live(profile, recent, now, start)
+                last_draw = now
+    except KeyboardInterrupt:
+        pass
+    sys.stdout.write("\x1b[H\x1b[2J")
+
+# Writes the events kept in a profile as a trace in the Chrome trace event
+# format, with one thread for each environment
+def write_trace(profile, filename):
+    threads = {}
+    trace = []
+    for name, start, time, depth, environment in sorted(profile["events"], key=lambda e: e[1]):
+        if environment not in threads:
+            threads[environment] = len(threads) + 1
+            trace.append({"name": "thread_name", "ph": "M", "pid": 1,
+                "tid": threads[environment], "args": {"name": environment}})
+        trace.append({"name": name, "ph": "X", "pid": 1, "tid": threads[environment],
+            "ts": start, "dur": time, "args": {"depth": depth}})
+    trace.append({"name": "process_name", "ph": "M", "pid": 1, "args": {"name": "Minetest"}})
+    with open(filename, "wt") as file:
+        json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, file)
+
+# Prints how long each environment spent in top-level profiled calls, and for
+# how long each number of environments was busy at once
+def print_concurrency(profile):
+    events = [event for event in profile["events"] if event[3] == 0]
+    if len(events) == 0:
+        print("No events with start times")
+        return
+    span_start = min(event[1] for event in events)
+    span = max(event[1] + event[2] for event in events) - span_start
+    busy = {}
+    changes = []
+    for name, start, time, depth, environment in events:
+        calls, busy_time = busy.get(environment, (0, 0))
+        busy[environment] = (calls + 1, busy_time + time)
+        changes += [(start, 1), (start + time, -1)]
+    print("Events from {} environments over {}".format(len(busy), time_format(span)))
+    print()
+    print("{:<32s}{:<12s}{:<12s}{:s}".format("ENVIRONMENT", "CALLS", "BUSY", "SHARE"))
+    for environment, (calls, busy_time) in sorted(busy.items(), key=lambda x: x[1][1],
+    reverse=True):
+        print("{:<32s}{:<12d}{:<12s}{:.1f}%".format(environment, calls, time_format(busy_time),
+            busy_time / max(span, 1) * 100))
+    # Time spent with each number of environments busy
+    running, last, spent = 0, span_start, {}
+    for time, change in sorted(changes):
+        spent[running] = spent.get(running, 0) + time - last
+        running, last = running + change, time
+    print()
+    print("{:<32s}{:<12s}{:s}".format("ENVIRONMENTS BUSY", "TIME", "SHARE"))
+    for running in sorted(spent):
+        print("{:<32d}{:<12s}{:.1f}%".format(running, time_format(spent[running]),
+            spent[running] / max(span, 1) * 100))
+    busy_time = sum(spent[running] for running in spent if running > 0)
+    print()
+    print("Average number of environments busy when any is: {:.2f}".format(
+        sum(running * time for running, time in spent.items()) / max(busy_time, 1)))
+
+# Returns a function giving the group of a value of an attribute: the value
+# itself, or for numbers with a fraction, one of a few ranges holding about as
+# many records each
+def attribute_groups(values):
+    try:
+        numbers = sorted(set(float(value) for value in values))
+    except ValueError:
+        return lambda value: value
+    if all(number.is_integer() for number in numbers) or len(numbers) <= 6:
+        return lambda value: value
+    edges = [numbers[len(numbers) * n // 5] for n in range(5)] + [numbers[-1]]
+    def group(value):
+        n = 0
+        while n < 4 and float(value) >= edges[n + 1]:
+            n += 1
+        return "{:.3g} - {:.3g}".format(edges[n], edges[n + 1])
+    return group
+
+# Returns the functions taking most of the self time of some records
+def top_functions(records, n=3):
+    self_times = {}
+    for record in records:
+        for name, (count, total, self_time) in record["functions"].items():
+            self_times[name] = self_times.get(name, 0) + self_time
+    # Self times estimated from sampled calls can come out negative
+    self_times = {name: max(self_time, 0) for name, self_time in self_times.items()}
+    total = sum(self_times.values())
+    top = sorted(self_times.items(), key=lambda x: x[1], reverse=True)[:n]
+    return ", ".join("{} {:.0f}%".format(name, self_time / max(total, 1) * 100)
+        for name, self_time in top)
+
+# Prints the number, average and total time of records with each value of an
+# attribute, and the functions taking most of their time
+def print_groups(profile, attribute):
+    records = [record for record in profile["records"] if attribute in record["tags"]]
+    if len(records) == 0:
+        print("No calls with attribute '{}'".format(attribute))
+        return
+    group = attribute_groups([record["tags"][attribute] for record in records])
+    groups = {}
+    for record in records:
+        groups.setdefault(group(record["tags"][attribute]), []).append(record)
+    print("{:<24s}{:<10s}{:<12s}{:<12s}{:s}".format(attribute.upper(), "CALLS", "AVERAGE", "TOTAL",
+        "SLOWEST FUNCTIONS (SELF TIME)"))
+    for value, group_records in sorted(groups.items(),
+    key=lambda x: sum(record["time"] for record in x[1]), reverse=True):
+        total = sum(record["time"] for record in group_records)
+        print("{:<24s}{:<10d}{:<12s}{:<12s}{:s}".format(value, len(group_records),
+            time_format(total / len(group_records)), time_format(total), top_functions(group_records)))
+
+# Characters of the chunk map, from least to most time
+map_shades = ".:-=+*#%@"
+# Map chunks are 80 nodes wide, starting at -32, by default
+chunk_size = 80
+chunk_offset = -32
+
+# Prints a map of the time spent on the records in each column of chunks, seen
+# from above with +Z up, and the slowest records
+def print_chunk_map(profile):
+    records = [record for record in profile["records"]
+        if "x" in record["tags"] and "z" in record["tags"]]
+    if len(records) == 0:
+        print("No calls with a position")
+        return
+    columns = {}
+    for record in records:
+        x = (int(record["tags"]["x"]) - chunk_offset) // chunk_size
+        z = (int(record["tags"]["z"]) - chunk_offset) // chunk_size
+        columns[(x, z)] = columns.get((x, z), 0) + record["time"]
+    min_x, max_x = min(x for x, z in columns), max(x for x, z in columns)
+    min_z, max_z = min(z for x, z in columns), max(z for x, z in columns)
+    # Several columns share a character if the map is wider than the terminal
+    scale = max(math.ceil((max_x - min_x + 1) / max(shutil.get_terminal_size().columns - 1, 1)), 1)
+    cells = {}
+    for (x, z), time in columns.items():
+        cell = ((x - min_x) // scale, (z - min_z) // scale)
+        cells[cell] = cells.get(cell, 0) + time
+    low, high = math.log(min(cells.values()) + 1), math.log(max(cells.values()) + 1)
+    def shade(time):
+        level = (math.log(time + 1) - low) / max(high - low, 1e-9)
+        return map_shades[min(int(level * len(map_shades)), len(map_shades) - 1)]
+    print("Time spent on chunks from x={} to x={}, z={} (top) to z={}, {} nodes per character".format(
+        min_x * chunk_size + chunk_offset, (max_x + 1) * chunk_size + chunk_offset - 1,
+        (max_z + 1) * chunk_size + chunk_offset - 1, min_z * chunk_size + chunk_offset,
+        scale * chunk_size))
+    for row in range((max_z - min_z) // scale, -1, -1):
+        print("".join(shade(cells[(column, row)]) if (column, row) in cells else " "
+            for column in range((max_x - min_x) // scale + 1)).rstrip())
+    print("Scale: '{}' {} to '{}' {}, logarithmic".format(map_shades[0],
+        time_format(math.exp(low) - 1), map_shades[-1], time_format(math.exp(high) - 1)))
+    print()
+    print("{:<12s}{:<24s}{:<16s}{:<16s}{:s}".format("TIME", "POSITION", "SEED", "ATMOSPHERE",
+        "SLOWEST FUNCTIONS (SELF TIME)"))
+    for record in sorted(records, key=lambda record: record["time"], reverse=True)[:10]:
+        tags = record["tags"]
+        print("{:<12s}{:<24s}{:<16s}{:<16s}{:s}".format(time_format(record["time"]),
+            ",".join(tags.get(axis, "?") for axis in "xyz"), tags.get("seed", "-"),
+            tags.get("atmosphere", "-"), top_functions([record])))
+
+# Returns the git commit of the mod, with '-dirty' if it has uncommitted
+# changes, such as profiling statements, or None if it's not a git repository
+def git_commit():
+    try:
+        result = subprocess.run(["git", "describe", "--always", "--dirty"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+    except FileNotFoundError:
+        return None
+    return result.stdout.strip() if result.returncode == 0 else None
+
+def save_run(profile, filename, metadata):
+    run = {
+        "metadata": metadata,
+        "paths": {";".join(path): stats for path, stats in profile["paths"].items()},
+        "distributions": profile["distributions"],
+        "counts": profile["counts"],
+        "records": profile["records"],
+    }
+    with open(filename, "wt") as file:
+        json.dump(run, file, indent=1)
+
+# Returns the profile and metadata of a saved run
+def load_run(filename):
+    with open(filename, "rt") as file:
+        run = json.load(file)
+    profile = new_profile()
+    profile["paths"] = {tuple(path.split(";")): stats for path, stats in run["paths"].items()}
+    for name, distribution in run["distributions"].items():
+        buckets = {int(index): count for index, count in distribution["buckets"].items()}
+        add_distribution(profile["distributions"], name, distribution["count"],
+            distribution["total"], distribution["min"], distribution["max"], buckets)
+    profile["counts"] = run["counts"]
+    profile["records"] = run.get("records", [])
+    limit_estimates(profile)
+    return profile, run["metadata"]
+
+def run_format(filename, metadata):
+    details = ["{}: {}".format(key, metadata[key]) for key in ("label", "commit", "seed")
+        if metadata.get(key) is not None]
+    details.append("{:.0f} s".format(metadata["duration"]))
+    return "{} ({})".format(filename, ", ".join(details))
+
+def change_format(before, after):
+    if before == 0:
+        return "-"
+    return "{:+.1f}%".format((after - before) / before * 100)
+
+# Prints the changes in each function from one saved run to another; returns
+# the functions whose average time per call grew by more than 'threshold' and
+# its confidence interval
+def print_comparison(before, after, threshold):
+    stats_before, stats_after = function_stats(before), function_stats(after)
+    print("NAME" + (40-4)*" " + "BEFORE" + (12-6)*" " + "AFTER" + (12-5)*" " + "CHANGE" +\
+    (10-6)*" " + "95% CI" + (10-6)*" " + "SELF" + (10-4)*" " + "P50" + (10-3)*" " + "P99" +\
+    (10-3)*" " + "TOTAL")
+    names = set(before["distributions"]) | set(after["distributions"])
+    names = sorted(names, key=lambda name: max(stats_before.get(name, {"total": 0})["total"],
+        stats_after.get(name, {"total": 0})["total"]), reverse=True)
+    regressions = []
+    for name in names:
+        if name not in before["distributions"] or name not in after["distributions"]:
+            print("{:<40s}{:s}".format(name, "only before" if name in before["distributions"] \
+                else "only after"))
+            continue
+        old, new = before["distributions"][name], after["distributions"][name]
+        old_mean, old_error = mean_error(old)
+        new_mean, new_error = mean_error(new)
+        # The 95% confidence interval of the difference of the means, relative
+        # to the mean before
+        interval = 1.96 * math.sqrt(old_error ** 2 + new_error ** 2) / max(old_mean, 1e-9)
+        change = (new_mean - old_mean) / max(old_mean, 1e-9)
+        flag = ""
+        if change > threshold and change > interval:
+            flag = "REGRESSION"
+            regressions.append(name)
+        elif change < -threshold and change < -interval:
+            flag = "faster"
+        print("{:<40s}{:<12s}{:<12s}{:<10s}{:<10s}{:<10s}{:<10s}{:<10s}{:<10s}{:s}".format(name,
+            time_format(old_mean), time_format(new_mean), change_format(old_mean, new_mean),
+            "±{:.1f}%".format(interval * 100),
+            change_format(stats_before[name]["self"] / stats_before[name]["count"],
+                stats_after[name]["self"] / stats_after[name]["count"]),
+            change_format(percentile(old, 0.5), percentile(new, 0.5)),
+            change_format(percentile(old, 0.99), percentile(new, 0.99)),
+            change_format(stats_before[name]["total"], stats_after[name]["total"]), flag))
+    return regressions
+
+def compare_runs(filenames, threshold):
+    profile, metadata = load_run(filenames[0])
+    regressions = []
+    for filename in filenames[1:]:
+        other, other_metadata = load_run(filename)
+        print("{} -> {}".format(run_format(filenames[0], metadata),
+            run_format(filename, other_metadata)))
+        regressions += ["{}: {}".format(filename, name)
+            for name in print_comparison(profile, other, threshold)]
+        print()
+    if len(regressions) > 0:
+        print("Regressions beyond {:.0f}%:".format(threshold * 100))
+        for regression in regressions:
+            print("  " + regression)
+        sys.exit(1)
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize profiling events read from stdin")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--tree", action="store_true", help="print the call tree")
+    group.add_argument("--folded", action="store_true",
+        help="print folded stacks of self time, in microseconds, for flame graph tools")
+    group.add_argument("--percentiles", action="store_true",
+        help="print percentiles of the call times of each function")
+    group.add_argument("--histogram", nargs="+", metavar="NAME",
+        help="print a histogram of the call times of the given functions")
+    group.add_argument("--by", metavar="ATTRIBUTE",
+        help="print the time of calls with each value of an attribute, e.g. seed")
+    group.add_argument("--chunk-map", action="store_true",
+        help="print a map of the time spent generating each column of chunks")
+    group.add_argument("--memory", action="store_true",
+        help="print the memory allocated by each function and its estimated share of GC work")
+    group.add_argument("--trace", metavar="FILE",
+        help="write a trace of all events for Perfetto or chrome://tracing, and print how "
+        "busy each environment was")
+    group.add_argument("--compare", nargs="+", metavar="RUN",
+        help="compare saved runs with the first one given, instead of reading events")
+    parser.add_argument("--sort", choices=["count", "total", "self"], default="self",
+        help="column to sort the table by")
+    parser.add_argument("--live", type=float, metavar="SECONDS",
+        help="redraw a table of recent calls at this interval while reading events")
+    parser.add_argument("--save", metavar="FILE", help="save the run as JSON")
+    parser.add_argument("--load", metavar="FILE", help="read a saved run instead of events")
+    parser.add_argument("--seed", help="world seed, saved with the run")
+    parser.add_argument("--label", help="description of the run, saved with it")
+    parser.add_argument("--threshold", type=float, default=0.1,
+        help="relative growth in average time per call flagged by '--compare'")
+    args = parser.parse_args()
+
+    if args.compare is not None:
+        if len(args.compare) < 2:
+            parser.error("--compare needs at least two runs")
+        compare_runs(args.compare, args.threshold)
+        return
+
+    if args.load is not None:
+        profile, metadata = load_run(args.load)
+    else:
+        profile = new_profile()
+        if args.trace is not None:
+            profile["events"] = []
+        start = time.time()
+        if args.live is not None:
+            run_live(profile, args.live)
+        else:
+            for line in sys.stdin:
+                parse_line(profile, line)
+        finish_profile(profile)
+        metadata = {"commit": git_commit(), "seed": args.seed, "label": args.label,
+            "date": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(start)),
+            "duration": time.time() - start}
+    if args.save is not None:
+        save_run(profile, args.save, metadata)
+    if args.tree:
+        print_tree(profile)
+    elif args.folded:
+        print_folded(profile)
+    elif args.percentiles:
+        print_percentiles(profile)
+    elif args.histogram is not None:
+        for name in args.histogram:
+            print_histogram(profile, name)
+    elif args.by is not None:
+        print_groups(profile, args.by)
+    elif args.chunk_map:
+        print_chunk_map(profile)
+    elif args.memory:
+        print_memory(profile)
+    elif args.trace is not None:
+        if profile["events"] is None:
+            parser.error("--trace needs events, not a saved run")
+        write_trace(profile, args.trace)
+        print_concurrency(profile)
+    else:
+        print_table(profile, args.sort)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,455 @@
+--[[
+This file runs the map generator in a standalone Lua interpreter, outside of
+Minetest, on a fixed list of planets and chunks. It's run by 'benchmark.py',
+which passes it the following arguments:
+    modpath     path of the 'nv_planetgen' directory
+    worldpath   directory for the files shared between environments
+    rounds      number of times to generate all the chunks
+    wrap        "true" to profile the map generator passes, if the mod isn't
+                already instrumented by 'profile.py'
+    seeds       planet seeds, separated by ','
+    chunks      chunk coordinates, as 'x,y,z' triplets separated by ';'
+    ...         settings, as 'key=value'
+
+For each chunk generated, a line 'benchmark_chunk round seed x y z time hash'
+is printed, with the time taken in microseconds and a hash of the node, light
+and param2 data of the whole area after generating it. Profiling output is
+printed as usual.
+
+The parts of the Minetest API used by the map generator are replaced by simple
+stand-ins written in Lua. These are deterministic, but they don't produce the
+same terrain as Minetest: noise is value noise with a different hash,
+'PcgRandom' is a linear congruential generator, and 'minetest.sha1' returns a
+hash of the same length that isn't SHA-1. Calls to the stand-ins for noise and
+hashing are profiled, so they don't count towards the self time of the map
+generator's functions.
+
+ # INDEX
+    MINETEST API
+    RANDOM NUMBERS
+    NOISE
+    VOXEL AREAS
+    ENTRY POINT
+]]--
+
+local modpath, worldpath, rounds, wrap, seeds_arg, chunks_arg = ...
+local settings = {}
+for n, setting in ipairs({select(7, ...)}) do
+    local key, value = setting:match("^([^=]+)=(.*)$")
+    settings[key] = value
+end
+
+--[[
+ # MINETEST API
+]]--
+
+minetest = {}
+
+minetest.CONTENT_UNKNOWN = 125
+minetest.CONTENT_AIR = 126
+minetest.CONTENT_IGNORE = 127
+
+minetest.settings = {
+    get = function (self, key)
+        return settings[key]
+    end,
+    get_bool = function (self, key)
+        if settings[key] == nil then
+            return nil
+        end
+        return settings[key] == "true"
+    end,
+}
+
+function minetest.get_us_time()
+    return math.floor(os.clock() * 1e+6)
+end
+
+function minetest.get_modpath(name)
+    return modpath .. "/../" .. name
+end
+
+function minetest.get_worldpath()
+    return worldpath
+end
+
+-- Content IDs are given in order of first use, skipping the reserved ones
+local content_ids = {
+    unknown = minetest.CONTENT_UNKNOWN,
+    air = minetest.CONTENT_AIR,
+    ignore = minetest.CONTENT_IGNORE,
+}
+local content_names = {}
+for name, id in pairs(content_ids) do
+    content_names[id] = name
+end
+local next_content_id = 0
+
+function minetest.get_content_id(name)
+    if content_ids[name] == nil then
+        while content_names[next_content_id] ~= nil do
+            next_content_id = next_content_id + 1
+        end
+        content_ids[name] = next_content_id
+        content_names[next_content_id] = name
+    end
+    return content_ids[name]
+end
+
+function minetest.get_name_from_content_id(id)
+    return content_names[id]
+end
+
+function minetest.register_node(name, definition)
+    minetest.get_content_id(name)
+end
+
+function minetest.register_alias(alias, name)
+end
+
+local function serialize_value(value)
+    if type(value) == "table" then
+        local parts = {}
+        for k, v in pairs(value) do
+            parts[#parts + 1] = "[" .. serialize_value(k) .. "]=" .. serialize_value(v)
+        end
+        return "{" .. table.concat(parts, ",") .. "}"
+    elseif type(value) == "string" then
+        return string.format("%q", value)
+    elseif type(value) == "number" then
+        return string.format("%.17g", value)
+    end
+    return tostring(value)
+end
+
+-- Output fits in one line, as files are read with 'f:read()'
+function minetest.serialize(value)
+    return "return " .. serialize_value(value)
+end
+
+function minetest.deserialize(data)
+    return (loadstring or load)(data)()
+end
+
+local function hash_mix(n)
+    n = (n * n * 7 + n * 60493 + 19990303) % 1048573
+    return (n * n * 7 + n * 60493 + 19990303) % 1048573
+end
+
+-- Not SHA-1, but 40 hexadecimal digits that depend on all of 'data'
+function minetest.sha1(data)
+    profile_start("minetest.sha1")
+    data = tostring(data)
+    local n = 0
+    for i = 1, #data do
+        n = hash_mix(n + data:byte(i))
+    end
+    local digits = {}
+    for i = 1, 8 do
+        n = hash_mix(n + i)
+        digits[i] = string.format("%05x", n)
+    end
+    return profile_return("minetest.sha1", table.concat(digits))
+end
+
+local shutdown_callbacks = {}
+
+function minetest.register_on_shutdown(callback)
+    table.insert(shutdown_callbacks, callback)
+end
+
+function minetest.register_on_generated(callback)
+end
+
+-- Only exists in mapgen environments, which 'mapgen.lua' checks for
+function minetest.save_gen_notify(id, data)
+    return true
+end
+
+--[[
+ # RANDOM NUMBERS
+]]--
+
+function PcgRandom(seed, sequence)
+    local state = (seed or 0) % 0x100000000
+    local increment = ((sequence or 0) * 2 + 1) % 0x100000000
+    local generator = {}
+    function generator:next(min, max)
+        -- The product stays below 2^53, so it's exact without integers
+        state = (state * 1664525 + increment) % 0x100000000
+        if min == nil then
+            return state - 0x80000000
+        end
+        return min + math.floor(state / 0x100000000 * (max - min + 1))
+    end
+    generator:next()
+    generator:next()
+    return generator
+end
+
+--[[
+ # NOISE
+]]--
+
+-- Value between -1 and 1 at a point of the integer lattice
+local function noise_lattice(x, y, z, seed)
+    return 1 - hash_mix((x * 1619 + y * 31337 + z * 52591 + seed * 1013) % 1048573) / 524286
+end
+
+local function noise_ease(t)
+    return t * t * (3 - 2 * t)
+end
+
+local function noise_2d(x, y, seed)
+    local x0, y0 = math.floor(x), math.floor(y)
+    local sx, sy = noise_ease(x - x0), noise_ease(y - y0)
+    local v00 = noise_lattice(x0, y0, 0, seed)
+    local v10 = noise_lattice(x0 + 1, y0, 0, seed)
+    local v01 = noise_lattice(x0, y0 + 1, 0, seed)
+    local v11 = noise_lattice(x0 + 1, y0 + 1, 0, seed)
+    local v0 = v00 + (v10 - v00) * sx
+    local v1 = v01 + (v11 - v01) * sx
+    return v0 + (v1 - v0) * sy
+end
+
+local function noise_3d(x, y, z, seed)
+    local x0, y0, z0 = math.floor(x), math.floor(y), math.floor(z)
+    local sx, sy, sz = noise_ease(x - x0), noise_ease(y - y0), noise_ease(z - z0)
+    local v000 = noise_lattice(x0, y0, z0, seed)
+    local v100 = noise_lattice(x0 + 1, y0, z0, seed)
+    local v010 = noise_lattice(x0, y0 + 1, z0, seed)
+    local v110 = noise_lattice(x0 + 1, y0 + 1, z0, seed)
+    local v001 = noise_lattice(x0, y0, z0 + 1, seed)
+    local v101 = noise_lattice(x0 + 1, y0, z0 + 1, seed)
+    local v011 = noise_lattice(x0, y0 + 1, z0 + 1, seed)
+    local v111 = noise_lattice(x0 + 1, y0 + 1, z0 + 1, seed)
+    local v00 = v000 + (v100 - v000) * sx
+    local v10 = v010 + (v110 - v010) * sx
+    local v01 = v001 + (v101 - v001) * sx
+    local v11 = v011 + (v111 - v011) * sx
+    local v0 = v00 + (v10 - v00) * sy
+    local v1 = v01 + (v11 - v01) * sy
+    return v0 + (v1 - v0) * sz
+end
+
+-- Adds up octaves of noise as Minetest does, given the noise parameters
+local function noise_octaves(params, x, y, z)
+    local spread = params.spread
+    local persistence = params.persistence or params.persist or 0.5
+    local lacunarity = params.lacunarity or 2
+    local frequency, amplitude, r = 1, 1, 0
+    for octave = 1, params.octaves or 1 do
+        local seed = (params.seed or 0) + octave
+        if z == nil then
+            r = r + noise_2d(x * frequency / spread.x, y * frequency / spread.y, seed) * amplitude
+        else
+            r = r + noise_3d(x * frequency / spread.x, y * frequency / spread.y,
+                z * frequency / spread.z, seed) * amplitude
+        end
+        frequency = frequency * lacunarity
+        amplitude = amplitude * persistence
+    end
+    return (params.offset or 0) + (params.scale or 1) * r
+end
+
+function PerlinNoise(params)
+    return {
+        get_2d = function (self, pos)
+            profile_start("minetest.PerlinNoise.get_2d")
+            return profile_return("minetest.PerlinNoise.get_2d",
+                noise_octaves(params, pos.x, pos.y))
+        end,
+        get_3d = function (self, pos)
+            profile_start("minetest.PerlinNoise.get_3d")
+            return profile_return("minetest.PerlinNoise.get_3d",
+                noise_octaves(params, pos.x, pos.y, pos.z))
+        end,
+    }
+end
+
+-- Maps are flat arrays with X varying fastest, then Y, then Z
+function PerlinNoiseMap(params, size)
+    return {
+        get_2d_map_flat = function (self, pos, buffer)
+            profile_start("minetest.PerlinNoiseMap.get_2d_map_flat")
+            buffer = buffer or {}
+            local i = 1
+            for y = 0, size.y - 1 do
+                for x = 0, size.x - 1 do
+                    buffer[i] = noise_octaves(params, pos.x + x, pos.y + y)
+                    i = i + 1
+                end
+            end
+            return profile_return("minetest.PerlinNoiseMap.get_2d_map_flat", buffer)
+        end,
+        get_3d_map_flat = function (self, pos, buffer)
+            profile_start("minetest.PerlinNoiseMap.get_3d_map_flat")
+            buffer = buffer or {}
+            local i = 1
+            for z = 0, size.z - 1 do
+                for y = 0, size.y - 1 do
+                    for x = 0, size.x - 1 do
+                        buffer[i] = noise_octaves(params, pos.x + x, pos.y + y, pos.z + z)
+                        i = i + 1
+                    end
+                end
+            end
+            return profile_return("minetest.PerlinNoiseMap.get_3d_map_flat", buffer)
+        end,
+    }
+end
+
+--[[
+ # VOXEL AREAS
+]]--
+
+VoxelArea = {}
+VoxelArea.__index = VoxelArea
+
+function VoxelArea:new(o)
+    o = o or {}
+    setmetatable(o, self)
+    local extent = o:getExtent()
+    o.ystride = extent.x
+    o.zstride = extent.x * extent.y
+    return o
+end
+
+function VoxelArea:getExtent()
+    return {
+        x = self.MaxEdge.x - self.MinEdge.x + 1,
+        y = self.MaxEdge.y - self.MinEdge.y + 1,
+        z = self.MaxEdge.z - self.MinEdge.z + 1
+    }
+end
+
+function VoxelArea:getVolume()
+    local extent = self:getExtent()
+    return extent.x * extent.y * extent.z
+end
+
+function VoxelArea:index(x, y, z)
+    local base = self.MinEdge
+    return (z - base.z) * self.zstride + (y - base.y) * self.ystride + x - base.x + 1
+end
+
+function VoxelArea:indexp(p)
+    return self:index(p.x, p.y, p.z)
+end
+
+function VoxelArea:contains(x, y, z)
+    local minp, maxp = self.MinEdge, self.MaxEdge
+    return x >= minp.x and x <= maxp.x and y >= minp.y and y <= maxp.y
+        and z >= minp.z and z <= maxp.z
+end
+
+function VoxelArea:containsp(p)
+    return self:contains(p.x, p.y, p.z)
+end
+
+--[[
+ # ENTRY POINT
+]]--
+
+local function write_world_file(name, value)
+    local f = io.open(worldpath .. "/" .. name, "wt")
+    f:write(minetest.serialize(value))
+    f:close()
+end
+
+local function hash_data(hash, data, size)
+    for i = 1, size do
+        hash = (hash * 65599 + data[i]) % 4294967291
+    end
+    return hash
+end
+
+-- Register nodes and create planets as 'api.lua' does, then load the map
+-- generator, which reads them from the world directory
+nv_planetgen = {}
+dofile(modpath .. "/util.lua")
+dofile(modpath .. "/meta.lua")
+dofile(modpath .. "/nodetypes.lua")
+nv_planetgen.random_yrot_nodes = {
+    [minetest.get_content_id("nv_planetgen:stone")] = 4
+}
+nv_planetgen.color_multiplier = {}
+nv_planetgen.register_all_nodes()
+
+local seeds = {}
+local planet_dictionary = {}
+for seed in seeds_arg:gmatch("[^,]+") do
+    seed = tonumber(seed)
+    local planet = generate_planet_metadata(seed)
+    nv_planetgen.choose_planet_nodes_and_colors(planet)
+    planet.num_mappings = 1
+    planet_dictionary[seed] = planet
+    table.insert(seeds, seed)
+end
+write_world_file("nv_planetgen.planet_dictionary", planet_dictionary)
+write_world_file("nv_planetgen.random_yrot_nodes", nv_planetgen.random_yrot_nodes)
+write_world_file("nv_planetgen.color_multiplier", nv_planetgen.color_multiplier)
+
+dofile(modpath .. "/mapgen.lua")
+
+if wrap == "true" then
+    for n, name in ipairs({
+        "generate_planet_chunk", "pass_elevation", "pass_caves", "pass_structures", "pass_final"
+    }) do
+        local fn = nv_planetgen[name]
+        local profile_name = "nv_planetgen." .. name
+        nv_planetgen[name] = function (...)
+            profile_start(profile_name)
+            return profile_return(profile_name, fn(...))
+        end
+    end
+end
+
+-- Chunks are generated for each seed in turn, in reverse order in every other
+-- round, so that results that depend on what was generated before show up as
+-- different hashes
+local jobs = {}
+for n, seed in ipairs(seeds) do
+    for x, y, z in chunks_arg:gmatch("(-?%d+),(-?%d+),(-?%d+)") do
+        table.insert(jobs, {seed = seed, x = tonumber(x), y = tonumber(y), z = tonumber(z)})
+    end
+end
+
+-- Each mapping covers the whole world, so every chunk is inside one
+local world_minp = {x=-30912, y=-30912, z=-30912}
+local world_maxp = {x=30927, y=30927, z=30927}
+local A, A1, A2 = {}, {}, {}
+for round = 1, tonumber(rounds) do
+    for n = 1, #jobs do
+        local job = round % 2 == 1 and jobs[n] or jobs[#jobs + 1 - n]
+        local minp = {x=job.x*80 - 32, y=job.y*80 - 32, z=job.z*80 - 32}
+        local maxp = {x=minp.x + 79, y=minp.y + 79, z=minp.z + 79}
+        -- Like Minetest, the area includes a margin of one block
+        local area = VoxelArea:new{
+            MinEdge = {x=minp.x - 16, y=minp.y - 16, z=minp.z - 16},
+            MaxEdge = {x=maxp.x + 16, y=maxp.y + 16, z=maxp.z + 16}
+        }
+        local volume = area:getVolume()
+        for i = 1, volume do
+            A[i] = minetest.CONTENT_AIR
+            A1[i] = 0
+            A2[i] = 0
+        end
+        local mapping = {
+            minp = world_minp,
+            maxp = world_maxp,
+            offset = {x=0, y=0, z=0},
+            seed = job.seed
+        }
+        local start = minetest.get_us_time()
+        nv_planetgen.generate_planet_chunk(minp, maxp, area, A, A1, A2, mapping)
+        local time = minetest.get_us_time() - start
+        local hash = hash_data(hash_data(hash_data(0, A, volume), A1, volume), A2, volume)
+        io.write(string.format("benchmark_chunk %d %d %d %d %d %d %08x\n", round, job.seed,
+            job.x, job.y, job.z, time, hash))
+    end
+end
+
+for n, callback in ipairs(shutdown_callbacks) do
+    callback()
+end
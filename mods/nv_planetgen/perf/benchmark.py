@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+
+# This is a Python script
+# It runs the map generator on a fixed list of planet seeds and chunks in a
+# standalone Lua interpreter, without Minetest, using 'benchmark.lua' as a
+# stand-in for the Minetest API, so that its performance can be measured
+# repeatably, e.g. before and after a change, or in automation. It prints the
+# number of chunks generated per second in each round, whether every chunk
+# came out the same in all rounds, and the table printed by 'analyze.py', with
+# the time spent in 'generate_planet_chunk' and each pass.
+
+# Chunks are generated several times with '--rounds', in reverse order in every
+# other round, and a hash of each generated chunk is compared between rounds.
+# With '--save-hashes FILE', the hashes are saved, and with '--check-hashes
+# FILE', they're compared with saved ones, so that an optimization can be
+# checked to leave the generated terrain unchanged; the script exits with an
+# error if any hash differs. With '--save FILE', the run is saved like with
+# 'analyze.py --save', so runs can be compared with 'analyze.py --compare'.
+
+# If the mod was instrumented by 'profile.py', all its profiled functions show
+# up in the table; otherwise, only 'generate_planet_chunk' and the passes are
+# profiled. Calls are added up in the interpreter, as with the
+# 'nv_planetgen_profile_interval' setting.
+
+# You can run it from the top directory of the mod, with LuaJIT installed, like
+# Minetest normally uses: 'python3 perf/benchmark.py'
+
+import argparse, json, os, re, subprocess, sys, tempfile, time
+
+import analyze
+
+re_chunk = re.compile(r"benchmark_chunk (\d+) (-?\d+) (-?\d+) (-?\d+) (-?\d+) (\d+) ([0-9a-f]+)")
+
+default_seeds = [1, 2, 3, 4]
+# Chunks at ground level and below it
+default_chunks = ["0,0,0", "1,0,0", "0,0,1", "0,-1,0"]
+
+def chunk_coordinates(value):
+    try:
+        x, y, z = map(int, value.split(","))
+    except ValueError:
+        raise argparse.ArgumentTypeError("chunk must be 'x,y,z', not '{}'".format(value))
+    return x, y, z
+
+# Returns whether any Lua file of the mod has profiling statements
+def is_instrumented(modpath):
+    for filename in os.listdir(modpath):
+        if filename.endswith(".lua"):
+            with open(os.path.join(modpath, filename), "rt") as f:
+                if "--[[auto-generated]]" in f.read():
+                    return True
+    return False
+
+# Runs the map generator, adding profiling output to 'profile'; returns the
+# chunks generated, as (round, seed, x, y, z, time, hash) tuples
+def run_benchmark(profile, args):
+    modpath = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    settings = ["nv_planetgen_profile_interval=3600"]
+    if args.memory:
+        settings.append("nv_planetgen_profile_memory=true")
+    chunks = []
+    with tempfile.TemporaryDirectory() as worldpath:
+        command = [args.lua, os.path.join(modpath, "perf", "benchmark.lua"), modpath, worldpath,
+            str(args.rounds), "false" if is_instrumented(modpath) else "true",
+            ",".join(map(str, args.seeds)),
+            ";".join("{},{},{}".format(*chunk) for chunk in args.chunks)] + settings
+        try:
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+        except FileNotFoundError:
+            sys.exit("Lua interpreter not found: {}; choose one with --lua".format(args.lua))
+        for line in process.stdout:
+            match = re_chunk.match(line)
+            if match is not None:
+                chunks.append(tuple(map(int, match.group(1, 2, 3, 4, 5, 6))) + (match.group(7),))
+            else:
+                analyze.parse_line(profile, line)
+        if process.wait() != 0:
+            sys.exit("The map generator failed")
+    analyze.finish_profile(profile)
+    return chunks
+
+def print_rounds(chunks):
+    print("ROUND" + (8-5)*" " + "CHUNKS" + (10-6)*" " + "CHUNKS/S" + (12-8)*" " + "AVERAGE" +\
+    (12-7)*" " + "SLOWEST")
+    for n in sorted(set(chunk[0] for chunk in chunks)):
+        times = [chunk[5] for chunk in chunks if chunk[0] == n]
+        print("{:<8d}{:<10d}{:<12.2f}{:<12s}{:s}".format(n, len(times),
+            len(times) / max(sum(times), 1) * 1e+6, analyze.time_format(sum(times) / len(times)),
+            analyze.time_format(max(times))))
+    print()
+
+def chunk_key(seed, x, y, z):
+    return "{} {},{},{}".format(seed, x, y, z)
+
+# Prints the chunks whose hashes differ between rounds or from 'expected', if
+# given; returns the number of them
+def check_hashes(hashes, expected):
+    differences = 0
+    for key, values in sorted(hashes.items()):
+        if len(set(values)) > 1:
+            print("Chunk {} differs between rounds: {}".format(key, " ".join(values)))
+            differences += 1
+        elif expected is not None and key in expected and expected[key] != values[0]:
+            print("Chunk {} differs from the saved hashes: {} instead of {}".format(key,
+                values[0], expected[key]))
+            differences += 1
+    if differences == 0:
+        print("All {} chunks were the same in every round{}".format(len(hashes),
+            " and as saved" if expected is not None else ""))
+    print()
+    return differences
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate a fixed set of chunks without Minetest and time it")
+    parser.add_argument("--seeds", nargs="+", type=int, default=default_seeds, metavar="SEED",
+        help="planet seeds to generate chunks of")
+    parser.add_argument("--chunks", nargs="+", type=chunk_coordinates,
+        default=[chunk_coordinates(chunk) for chunk in default_chunks], metavar="X,Y,Z",
+        help="chunks to generate on each planet, in chunk coordinates (80 nodes)")
+    parser.add_argument("--rounds", type=int, default=2,
+        help="number of times to generate all the chunks")
+    parser.add_argument("--lua", default="luajit", help="Lua interpreter to run")
+    parser.add_argument("--memory", action="store_true",
+        help="also record memory allocation, for 'analyze.py --memory'")
+    parser.add_argument("--sort", choices=["count", "total", "self"], default="self",
+        help="column to sort the table by")
+    parser.add_argument("--save", metavar="FILE", help="save the run as JSON")
+    parser.add_argument("--label", help="description of the run, saved with it")
+    parser.add_argument("--save-hashes", metavar="FILE", help="save the hash of each chunk")
+    parser.add_argument("--check-hashes", metavar="FILE",
+        help="compare the hash of each chunk with those saved")
+    args = parser.parse_args()
+
+    profile = analyze.new_profile()
+    start = time.time()
+    chunks = run_benchmark(profile, args)
+    if len(chunks) == 0:
+        sys.exit("No chunks generated")
+    print_rounds(chunks)
+
+    hashes = {}
+    for n, seed, x, y, z, _, chunk_hash in chunks:
+        hashes.setdefault(chunk_key(seed, x, y, z), []).append(chunk_hash)
+    expected = None
+    if args.check_hashes is not None:
+        with open(args.check_hashes, "rt") as file:
+            expected = json.load(file)
+    differences = check_hashes(hashes, expected)
+    if args.save_hashes is not None:
+        with open(args.save_hashes, "wt") as file:
+            json.dump({key: values[0] for key, values in hashes.items()}, file, indent=1)
+
+    analyze.print_table(profile, args.sort)
+    if args.save is not None:
+        metadata = {"commit": analyze.git_commit(), "seed": " ".join(map(str, args.seeds)),
+            "label": args.label, "date": time.strftime("%Y-%m-%d %H:%M:%S",
+            time.localtime(start)), "duration": time.time() - start}
+        analyze.save_run(profile, args.save, metadata)
+    if differences > 0:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -2,94 +2,293 @@
 
 # This is a Python script
 # When run from the command-line, it automatically adds profiling statements to
-# all Lua scripts in the current directory. By default, they are added at the
-# start and end of all named functions in the global scope. In reality, it
-# relies on indentation to identify blocks, and will not act on lines with
-# comments, so it is coding-style-specific.
+# all Lua scripts in the current directory. They are added to all named
+# functions ('function a.b(...)', 'local function f(...)') and all functions
+# assigned to a variable or table field ('f = function (...)'); anonymous
+# functions passed as arguments are left alone. Scripts are read with a Lua
+# tokenizer, so comments, strings, one-line functions and nested closures don't
+# confuse it.
+
+# Each profiled function calls 'profile_start()' right after its parameters,
+# and 'profile_end()' before its final 'end'. Every 'return' is rewritten as
+# 'return profile_return(name, ...)', which ends the call after its values are
+# computed and returns them all, so calls in 'return' statements, including tail
+# calls, are counted in the function's time. Functions whose names start with
+# 'profile_' are the profiler itself, and are never profiled.
+
+# The statements are inserted on the lines they belong to, so line numbers in
+# error messages don't change. Each is marked with the comment
+# '--[[auto-generated]]', by which 'unprofile.py' finds and removes them; if you
+# change the inserted text below, edit 'unprofile.py' too. Scripts that are
+# already profiled are unprofiled first, so running this script twice is safe.
+
+# Timing every call to a tiny function takes about as long as the function
+# itself. To profile with less overhead, e.g. during a real game, pass the table
+# printed by 'analyze.py' for an earlier run, or the run saved with its
+# '--save', with '--profile'. Functions called
+# at least 'min_calls' times in it are then sampled if their average time was
+# below '--sample-below' microseconds, timing only 1 in every '--sample-rate'
+# calls, or only counted if it was below '--count-below', which should be about
+# the resolution of the timer. Others are profiled fully. With '--include' and
+# '--exclude', only functions whose names match the given patterns, or don't,
+# are profiled at all, e.g. 'python3 perf/profile.py --include "elevation_*"'.
 
 # You can run it by entering the directory you want to apply it on (in this
 # case, the top directory for the mod) and running: 'python3 perf/profile.py'
 
-# The inserted lines can be set to other values, but remember:
-# * There can be at most one '{}', that will be replaced with the function name.
-# * The exact phrase '-- auto-generated' is recognized by 'unprofile.py' and by
-#   this script, so either don't change it or edit both files.
-# * The trailing '\n' is required.
-profile_start = 'profile_start("{}") -- auto-generated\n'
-profile_end = 'profile_end("{}") -- auto-generated\n'
-
-import os, re
-
-re_function = re.compile(r"^(local )?function ([a-zA-Z0-9_.]+)")
-cwd = os.getcwd()
-for filename in os.listdir(cwd):
-    if filename.endswith(".lua"):
-        with open(filename, "r+t") as f:
-            output_lines = []
-            function_name = None
-            defined = False
-            comment = False
-            return_indent = None
-            lambda_indent = None
-            for line in f:
-                # Skip all comment lines
-                if comment:
-                    if line.find("]]") >= 0:
-                        comment = False
-                    output_lines.append(line)
-                    continue
-                if line.find("--") >= 0:
-                    output_lines.append(line)
-                    continue
-                if line.find("--[[") >= 0:
-                    comment = True
-                    output_lines.append(line)
-                    continue
-
-                # Inside a function
-                if function_name is not None:
-                    pos = line.find("return")
-                    if pos == 0 or pos > 0 and line[0:pos].isspace() and (lambda_indent is None or pos <= lambda_indent):
-                        output_lines.append(pos*" " + profile_end.format(function_name))
-                        return_indent = pos
-                    else:
-                        if line.find("function") >= 0:
-                            lambda_indent = len(line) - len(line.lstrip())
-                        else:
-                            pos = line.find("end")
-                            if pos > 0 and return_indent is not None and pos <= return_indent:
-                                return_indent = None
-                            if pos > 0 and lambda_indent is not None and pos <= lambda_indent:
-                                lambda_indent = None
-                            elif pos == 0:
-                                if return_indent is None:
-                                    output_lines.append("    " + profile_end.format(function_name))
-                                defined = False
-                                return_indent = None
-                                function_name = None
-
-                output_lines.append(line)
-
-                match = re_function.match(line)
-                if match is not None:
-                    function_name = match.group(2)
-                if not defined and function_name is not None and line.find(")") >= 0:
-                    output_lines.append("    " + profile_start.format(function_name))
-                    defined = True
-            final_output_lines = []
-            held_line = None
-            for line in output_lines:
-                if line.find("-- auto-generated") >= 0:
-                    if held_line is not None:
-                        held_line = None
-                    else:
-                        held_line = line
-                else:
-                    if held_line is not None:
-                        final_output_lines.append(held_line)
-                        held_line = None
-                    final_output_lines.append(line)
-            f.seek(0)
-            for line in final_output_lines:
-                f.write(line)
-            f.truncate()
+profile_start = ' profile_start("{}") --[[auto-generated]]'
+profile_sample = ' local profile_sampled = profile_sample("{}", {}) --[[auto-generated]]'
+profile_count = ' profile_count("{}") --[[auto-generated]]'
+# These take the argument of 'profile_end()', which is the quoted name of the
+# function, or 'profile_sampled' for sampled functions
+profile_end = 'profile_end({}) --[[auto-generated]] '
+profile_return_open = ' profile_return({}, --[[auto-generated]]'
+profile_return_close = ' --[[auto-generated]])'
+
+import argparse, fnmatch, os, re, sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import analyze
+from unprofile import unprofile
+
+re_token = re.compile(r"""
+    (?P<space>\s+)
+    |(?P<comment>--\[(?P<comment_level>=*)\[.*?\](?P=comment_level)\]|--[^\n]*)
+    |(?P<string>"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*'|\[(?P<string_level>=*)\[.*?\](?P=string_level)\])
+    |(?P<number>0[xX](?:[0-9a-fA-F.]|[pP][+-]?)*|(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+    |(?P<name>[A-Za-z_][A-Za-z0-9_]*)
+    |(?P<symbol>\.\.\.|\.\.|==|~=|<=|>=|::|//|<<|>>|.)
+""", re.VERBOSE | re.DOTALL)
+
+keywords = {"and", "break", "do", "else", "elseif", "end", "false", "for", "function", "goto",
+    "if", "in", "local", "nil", "not", "or", "repeat", "return", "then", "true", "until", "while"}
+
+# Tokens that end the value list of a 'return' statement, which must be the last
+# statement of its block
+return_terminators = {"end", "else", "elseif", "until", ";"}
+
+# Returns the tokens of a Lua script, without spaces and comments, as (kind,
+# text, start, end) tuples, where 'kind' is "keyword", "name", "number",
+# "string" or "symbol", and 'start' and 'end' are offsets in the source
+def tokenize(source):
+    tokens = []
+    pos = 0
+    while pos < len(source):
+        match = re_token.match(source, pos)
+        kind = match.lastgroup
+        if kind in ("comment_level", "string_level"):
+            kind = kind[:-len("_level")]
+        if kind == "name" and match.group() in keywords:
+            kind = "keyword"
+        if kind not in ("space", "comment"):
+            tokens.append((kind, match.group(), match.start(), match.end()))
+        pos = match.end()
+    return tokens
+
+# Returns the name assigned to by the tokens before 'index', which must be '=',
+# e.g. 'f' in 'local f =' or 'a.b.c' in 'a.b.c =', or None if they aren't a
+# plain name or field
+def assigned_name(tokens, index):
+    if index < 1 or tokens[index][1] != "=" or tokens[index - 1][0] != "name":
+        return None
+    n = index - 1
+    while n >= 2 and tokens[n - 1][1] == "." and tokens[n - 2][0] == "name":
+        n -= 2
+    if n >= 1 and tokens[n - 1][1] in (".", ":", "]", ")"):
+        return None
+    return "".join(token[1] for token in tokens[n:index])
+
+# Returns the name of the function whose 'function' keyword is at 'index', or
+# None if it's anonymous, and the index of the closing parenthesis of its
+# parameters
+def function_name(tokens, index, brackets, functions):
+    n = index + 1
+    if tokens[n][0] == "name":
+        while tokens[n + 1][1] in (".", ":"):
+            n += 2
+        name = "".join(token[1] for token in tokens[index + 1:n + 1])
+        n += 1
+    else:
+        name = assigned_name(tokens, index - 1)
+        # Fields in table constructors are named after the table if it's
+        # assigned to something, or else after the function building it
+        if name is not None and len(brackets) > 0 and brackets[-1][0] == "{" and \
+        tokens[index - 3][1] in ("{", ",", ";"):
+            prefix = brackets[-1][1]
+            if prefix is None:
+                prefix = next((f["name"] for f in reversed(functions) if f["name"] is not None), None)
+            if prefix is not None:
+                name = prefix + "." + name
+    while tokens[n][1] != ")":
+        n += 1
+    return name, n
+
+min_calls = 1000
+
+re_table_row = re.compile(r"(\S+)\s+(\d+)\s+(-|[0-9.]+ (?:us|ms|s))\s")
+time_units = {"us": 1, "ms": 1e+3, "s": 1e+6}
+
+# Reads a table printed by 'analyze.py', or a run it saved as JSON; returns the
+# number of calls and the average time in microseconds of each function, or
+# None for the latter if its calls were only counted
+def read_profile(filename):
+    if filename.endswith(".json"):
+        profile, metadata = analyze.load_run(filename)
+        functions = {name: (count, None) for name, count in profile["counts"].items()}
+        for name, stats in analyze.function_stats(profile).items():
+            # Functions never timed by sampling only hold the calls made inside them
+            if stats["count"] > 0:
+                functions[name] = (stats["count"], stats["total"] / stats["count"])
+        return functions
+    functions = {}
+    with open(filename, "rt") as file:
+        for line in file:
+            match = re_table_row.match(line)
+            if match is None:
+                continue
+            average = None
+            if match.group(3) != "-":
+                value, unit = match.group(3).split()
+                average = float(value) * time_units[unit]
+            functions[match.group(1)] = (int(match.group(2)), average)
+    return functions
+
+# Returns how to profile a function: None to leave it alone, "full" to time
+# every call, "count" to only count calls, or n to time 1 in every n calls
+def choose_policy(name, args, previous):
+    if args.include is not None and not any(fnmatch.fnmatchcase(name, p) for p in args.include):
+        return None
+    if args.exclude is not None and any(fnmatch.fnmatchcase(name, p) for p in args.exclude):
+        return None
+    if name in previous:
+        count, average = previous[name]
+        if count >= min_calls:
+            if average is None or average < args.count_below:
+                return "count"
+            if average < args.sample_below:
+                return args.sample_rate
+    return "full"
+
+# Returns the source code of a Lua script with profiling statements added;
+# 'policy' takes the name of each function, and returns how to profile it, as
+# 'choose_policy' does
+def instrument(source, policy=lambda name: "full"):
+    tokens = tokenize(source)
+    # Text to insert, as (offset, order, text); 'order' keeps insertions at the
+    # same offset in the order they are made
+    insertions = []
+    def insert(offset, text):
+        insertions.append((offset, len(insertions), text))
+
+    # Open blocks, each {"kind": "function", "name": name or None, "excluded":
+    # bool, "end": argument of 'profile_end()' or None} or {"kind": "block"};
+    # open brackets as (character, name of the table);
+    # 'return' statements being read, as (index of 'return', function, number
+    # of open blocks and brackets)
+    blocks = []
+    brackets = []
+    returns = []
+    # Functions being read, innermost last
+    functions = []
+
+    def end_return(index):
+        start, function, _, _ = returns.pop()
+        if index == start + 1:
+            insert(tokens[start][2], profile_end.format(function["end"]))
+        else:
+            insert(tokens[start][3], profile_return_open.format(function["end"]))
+            insert(tokens[index - 1][3], profile_return_close)
+        if len(blocks) > 0 and blocks[-1] is function:
+            function["returned"] = index if tokens[index][1] == "end" else index + 1
+
+    n = 0
+    while n < len(tokens):
+        kind, text = tokens[n][0], tokens[n][1]
+        if len(returns) > 0 and returns[-1][2:] == (len(blocks), len(brackets)) and \
+        text in return_terminators:
+            end_return(n)
+
+        if kind == "keyword":
+            if text == "function":
+                name, parameters_end = function_name(tokens, n, brackets, functions)
+                # Functions inside the profiler aren't profiled either
+                excluded = (name is not None and name.startswith("profile_")) or \
+                    (len(functions) > 0 and functions[-1]["excluded"])
+                function = {"kind": "function", "name": None if excluded else name,
+                    "excluded": excluded, "end": None}
+                blocks.append(function)
+                functions.append(function)
+                how = policy(name) if function["name"] is not None else None
+                if how == "full":
+                    insert(tokens[parameters_end][3], profile_start.format(name))
+                    function["end"] = '"{}"'.format(name)
+                elif how == "count":
+                    insert(tokens[parameters_end][3], profile_count.format(name))
+                elif how is not None:
+                    insert(tokens[parameters_end][3], profile_sample.format(name, how))
+                    function["end"] = "profile_sampled"
+                n = parameters_end
+            elif text in ("do", "if", "repeat"):
+                blocks.append({"kind": "block"})
+            elif text in ("end", "until"):
+                block = blocks.pop()
+                if block.get("kind") == "function":
+                    functions.pop()
+                    if block["end"] is not None and block.get("returned") != n:
+                        insert(tokens[n][2], profile_end.format(block["end"]))
+            elif text == "return" and len(functions) > 0 and functions[-1]["end"] is not None:
+                returns.append((n, functions[-1], len(blocks), len(brackets)))
+        elif kind == "symbol":
+            if text in ("(", "["):
+                brackets.append((text, None))
+            elif text == "{":
+                brackets.append((text, assigned_name(tokens, n - 1)))
+            elif text in (")", "]", "}"):
+                brackets.pop()
+        n += 1
+    if len(returns) > 0:
+        end_return(len(tokens))
+
+    for offset, _, text in sorted(insertions, reverse=True):
+        source = source[:offset] + text + source[offset:]
+    return source
+
+def main():
+    parser = argparse.ArgumentParser(description="Add profiling statements to Lua scripts")
+    parser.add_argument("--include", nargs="+", metavar="PATTERN",
+        help="only profile functions whose names match any of these patterns")
+    parser.add_argument("--exclude", nargs="+", metavar="PATTERN",
+        help="don't profile functions whose names match any of these patterns")
+    parser.add_argument("--profile", metavar="FILE",
+        help="table printed by 'analyze.py' for an earlier run, or the run it saved, to choose "
+        "how to profile functions called often")
+    parser.add_argument("--sample-below", type=float, default=20, metavar="US",
+        help="time 1 in every '--sample-rate' calls to functions faster than this on average")
+    parser.add_argument("--sample-rate", type=int, default=64, metavar="N",
+        help="number of calls to sampled functions for each one timed")
+    parser.add_argument("--count-below", type=float, default=1, metavar="US",
+        help="only count calls to functions faster than this on average")
+    args = parser.parse_args()
+    previous = read_profile(args.profile) if args.profile is not None else {}
+
+    # Functions profiled in each way, by policy
+    chosen = {}
+    def policy(name):
+        how = choose_policy(name, args, previous)
+        chosen.setdefault(how, set()).add(name)
+        return how
+
+    cwd = os.getcwd()
+    for filename in os.listdir(cwd):
+        if filename.endswith(".lua"):
+            with open(filename, "r+t") as f:
+                source = instrument(unprofile(f.read()), policy)
+                f.seek(0)
+                f.write(source)
+                f.truncate()
+    print("Profiled {} functions fully, {} 1 call in {}, and counted calls to {}".format(
+        len(chosen.get("full", ())), len(chosen.get(args.sample_rate, ())), args.sample_rate,
+        len(chosen.get("count", ()))))
+
+if __name__ == "__main__":
+    main()
@@ -2,26 +2,38 @@
 
 # This is a Python script
 # When run from the command-line, it undoes any changes performed by
-# 'profile.py' on Lua files in the current directory. By default, it recognizes
-# lines with the phrase '-- auto-generated' and deletes them.
+# 'profile.py' on Lua files in the current directory. It recognizes the
+# statements 'profile.py' inserts by the comment '--[[auto-generated]]' that
+# follows or precedes each of them, and deletes them. Whole lines with the
+# phrase '-- auto-generated', inserted by older versions, are deleted too.
 
 # You can run it by entering the directory you want to apply it on (in this
 # case, the top directory for the mod) and running: 'python3 perf/unprofile.py'
 
 import os, re
 
-re_function = re.compile(r"function (\w+)")
-re_end = re.compile(r"end$")
-cwd = os.getcwd()
-for filename in os.listdir(cwd):
-    if filename.endswith(".lua"):
-        with open(filename, "r+t") as f:
-            output_lines = []
-            for line in f:
-                if line.find("-- auto-generated") >= 0:
-                    continue
-                output_lines.append(line)
-            f.seek(0)
-            for line in output_lines:
-                f.write(line)
-            f.truncate()
+re_inserted = re.compile(
+    r' profile_(?:start|count)\("[^"\n]*"\) --\[\[auto-generated\]\]'
+    r'| local profile_sampled = profile_sample\("[^"\n]*", \d+\) --\[\[auto-generated\]\]'
+    r'|profile_end\((?:"[^"\n]*"|profile_sampled)\) --\[\[auto-generated\]\] '
+    r'| profile_return\((?:"[^"\n]*"|profile_sampled), --\[\[auto-generated\]\]'
+    r'| --\[\[auto-generated\]\]\)')
+
+# Returns the source code of a Lua script without profiling statements
+def unprofile(source):
+    lines = source.splitlines(keepends=True)
+    source = "".join(line for line in lines if line.find("-- auto-generated") < 0)
+    return re_inserted.sub("", source)
+
+def main():
+    cwd = os.getcwd()
+    for filename in os.listdir(cwd):
+        if filename.endswith(".lua"):
+            with open(filename, "r+t") as f:
+                source = unprofile(f.read())
+                f.seek(0)
+                f.write(source)
+                f.truncate()
+
+if __name__ == "__main__":
+    main()
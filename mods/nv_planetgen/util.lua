@@ -16,19 +16,370 @@ function table_copy(tab)
     return r
 end
 
+--[[
+Profiling functions, see 'perf/README.md'. Calls to 'profile_start' and
+'profile_end' nest like a stack; each 'profile_end' prints the name of the
+function, the time since the matching 'profile_start' in microseconds, the
+number of profiled calls it was nested in, the number of calls it stands for
+(see below), the time it started, and the environment it ran in.
+
+This file is loaded separately by each environment, the main one and that of
+each emerge thread running mapgen scripts, so each has its own stack. Each
+environment gets an ID, so that events from emerge threads running at the same
+time can be told apart, and events are written with a single call, so that
+lines from different threads aren't mixed.
+
+If the 'nv_planetgen_profile_interval' setting is a number of seconds, calls
+are added up instead, by chain of profiled calls leading to them, and a summary
+is printed at that interval, once the outermost profiled call ends. For each
+chain, it has the number of calls, their total, self, minimum and maximum time,
+and a histogram with 8 buckets per power of 2. This avoids printing an event
+for every call, which takes more time than many of the functions profiled.
+
+Functions called very often can be profiled more cheaply. 'profile_sample'
+times only 1 in every n calls to a function, and each call it times stands for
+n calls; sampled functions called directly by such a call are timed on every
+call, standing for 1 call each. The other calls are still put on the stack,
+with a weight of 0 and without timing them, so that profiled calls made inside
+them are nested in them rather than in their caller, whose self time already
+excludes them by the estimate. Such a call isn't printed, unless it had
+profiled calls inside it and events are printed, in which case it's printed
+with a time and weight of 0 so that they can be nested. 'profile_sample'
+returns the name of the function, to pass to 'profile_end'. 'profile_count'
+only counts calls; counts are printed with summaries, or every second without
+them.
+
+'profile_tag' attaches an attribute to the innermost open profiled call, e.g.
+the position of the chunk or the planet being generated. When a call with
+attributes ends, a record is printed with its name, time, its attributes and
+those of the calls it's nested in, and the count, total and self time of each
+profiled function called inside it, including itself. Keys and values can't
+contain spaces, ';', ':', ',' or '='. Without any open profiled call,
+'profile_tag' does nothing, so it can be left in the code.
+
+If the 'nv_planetgen_profile_memory' setting is true, the memory allocated and
+freed by each call is recorded as well, in bytes, and added to its event or
+summary. Lua only tells how much memory is in use, so the changes in it seen at
+each 'profile_start' and 'profile_end' are added up: increases as allocation,
+and decreases as memory freed by the garbage collector. Memory used by the
+profiler itself is left out.
+]]
+
+local profile_names = {}
 local profile_times = {}
+local profile_weights = {}
+
+-- 'save_gen_notify' only exists in mapgen environments; the address of a table
+-- is unique to this environment, as long as it exists
+local profile_environment = (minetest.save_gen_notify and "emerge-" or "main-") ..
+    (tostring(profile_names):match("0x(%x+)") or tostring(profile_names):match("(%x+)$"))
+
+local function profile_write(line)
+    io.write(line .. "\n")
+end
+
+local profile_interval = minetest.settings and
+    tonumber(minetest.settings:get("nv_planetgen_profile_interval") or "")
+if profile_interval ~= nil and profile_interval <= 0 then
+    profile_interval = nil
+end
+local profile_memory = minetest.settings and
+    minetest.settings:get_bool("nv_planetgen_profile_memory")
+-- Memory allocated and freed so far, and the memory in use when last seen, in
+-- kB; memory allocated and freed when each open call started, and memory
+-- allocated by profiled calls inside it, by depth
+local profile_allocated, profile_freed, profile_memory_used = 0, 0, collectgarbage("count")
+local profile_start_allocated = {}
+local profile_start_freed = {}
+local profile_children_allocated = {}
+
+-- Chain of calls leading to each open call, time spent in profiled calls inside
+-- it, and whether any profiled call ended inside it, by depth
+local profile_paths = {}
+local profile_children = {}
+local profile_nested = {}
+-- Chains are built once and looked up later, as '[parent][name]'
+local profile_path_cache = {[""] = {}}
+-- Statistics of each chain since the last summary
+local profile_stats = {}
+local profile_last_summary = minetest.get_us_time()
+local profile_log2 = math.log(2)
+-- Calls left until the next sampled call, and calls counted since the last
+-- summary, by function name
+local profile_countdowns = {}
+local profile_counts = {}
+-- Attributes of calls, and statistics of the functions called inside them, as
+-- '[name] = {count, total, self}', by depth; depths of calls with attributes,
+-- innermost last
+local profile_tags = {}
+local profile_breakdowns = {}
+local profile_tagged = {}
+
+local function profile_update_memory()
+    local used = collectgarbage("count")
+    if used >= profile_memory_used then
+        profile_allocated = profile_allocated + used - profile_memory_used
+    else
+        profile_freed = profile_freed + profile_memory_used - used
+    end
+    profile_memory_used = used
+end
+
+local function profile_print_summary()
+    for path, stats in pairs(profile_stats) do
+        local buckets = {}
+        for bucket, count in pairs(stats.buckets) do
+            buckets[#buckets + 1] = bucket .. ":" .. count
+        end
+        local line = string.format("profile_summary %s %d %d %d %d %d %s", path, stats.count,
+            stats.total, stats.self, stats.min, stats.max, table.concat(buckets, ","))
+        if profile_memory then
+            line = line .. string.format(" %d %d %d", stats.allocated, stats.self_allocated,
+                stats.freed)
+        end
+        profile_write(line)
+    end
+    for name, count in pairs(profile_counts) do
+        profile_write(string.format("profile_count %s %d", name, count))
+    end
+    profile_stats = {}
+    profile_counts = {}
+end
+
+-- Puts a call on the stack without starting its timer; returns its depth
+local function profile_push(name, weight)
+    local depth = #profile_names + 1
+    profile_names[depth] = name
+    profile_weights[depth] = weight
+    if profile_interval ~= nil then
+        local parent = profile_paths[depth - 1] or ""
+        local path = profile_path_cache[parent][name]
+        if path == nil then
+            path = parent == "" and name or parent .. ";" .. name
+            profile_path_cache[parent][name] = path
+            profile_path_cache[path] = {}
+        end
+        profile_paths[depth] = path
+    end
+    profile_children[depth] = 0
+    if profile_memory then
+        profile_update_memory()
+        profile_start_allocated[depth] = profile_allocated
+        profile_start_freed[depth] = profile_freed
+        profile_children_allocated[depth] = 0
+        profile_memory_used = collectgarbage("count")
+    end
+    return depth
+end
 
-function profile_start(name) --
-    profile_times[name] = minetest.get_us_time()
+-- Removes the calls from 'depth' up from the stack
+local function profile_pop(depth)
+    for n = #profile_names, depth, -1 do
+        profile_names[n] = nil
+        profile_times[n] = nil
+        profile_weights[n] = nil
+        profile_paths[n] = nil
+        profile_children[n] = nil
+        profile_nested[n] = nil
+        profile_start_allocated[n] = nil
+        profile_start_freed[n] = nil
+        profile_children_allocated[n] = nil
+    end
 end
 
-function profile_end(name) --
-    if profile_times[name] == nil then
-        print(string.format("Profiling not started: %s", name))
+function profile_start(name, weight)
+    local depth = profile_push(name, weight or 1)
+    profile_times[depth] = minetest.get_us_time()
+end
+
+function profile_sample(name, n)
+    -- Calls made directly by a sampled call that is timed are timed exactly;
+    -- otherwise functions called as often as their caller could be sampled on
+    -- the same calls, and their weights would be subtracted from its self time
+    if (profile_weights[#profile_names] or 1) > 1 then
+        profile_start(name, 1)
+        return name
+    end
+    local countdown = profile_countdowns[name] or 1
+    if countdown > 1 then
+        profile_countdowns[name] = countdown - 1
+        profile_push(name, 0)
+        return name
+    end
+    profile_countdowns[name] = n
+    profile_start(name, n)
+    return name
+end
+
+function profile_count(name)
+    profile_counts[name] = (profile_counts[name] or 0) + 1
+end
+
+function profile_tag(key, value)
+    local depth = #profile_names
+    if depth == 0 then
         return
     end
-    local time = minetest.get_us_time() - profile_times[name]
-    print(string.format("%s %d", name, time))
+    if profile_tags[depth] == nil then
+        profile_tags[depth] = {}
+        profile_breakdowns[depth] = {}
+        profile_tagged[#profile_tagged + 1] = depth
+    end
+    profile_tags[depth][key] = tostring(value)
+end
+
+-- Adds a call that ended at 'depth' to the breakdowns of the calls with
+-- attributes it's nested in, and prints the record of the call if it has
+-- attributes itself
+local function profile_add_breakdown(name, time, children, weight, depth)
+    for n = 1, #profile_tagged do
+        local tagged = profile_tagged[n]
+        if tagged <= depth then
+            local stats = profile_breakdowns[tagged][name]
+            if stats == nil then
+                stats = {0, 0, 0}
+                profile_breakdowns[tagged][name] = stats
+            end
+            stats[1] = stats[1] + weight
+            stats[2] = stats[2] + time * weight
+            stats[3] = stats[3] + (time - children) * weight
+        end
+    end
+    local last = profile_tagged[#profile_tagged]
+    if last == depth then
+        local tags = {}
+        for n = 1, #profile_tagged do
+            for key, value in pairs(profile_tags[profile_tagged[n]]) do
+                tags[key] = value
+            end
+        end
+        local parts = {}
+        for key, value in pairs(tags) do
+            parts[#parts + 1] = key .. "=" .. value
+        end
+        local functions = {}
+        for function_name, stats in pairs(profile_breakdowns[depth]) do
+            functions[#functions + 1] = string.format("%s:%d:%d:%d", function_name, stats[1],
+                stats[2], stats[3])
+        end
+        profile_write(string.format("profile_tag %s %d %s %s", name, time, table.concat(parts, ";"),
+            table.concat(functions, ",")))
+    end
+    -- Calls with attributes that ended, or were discarded by 'profile_end'
+    while last ~= nil and last >= depth do
+        profile_tags[last] = nil
+        profile_breakdowns[last] = nil
+        profile_tagged[#profile_tagged] = nil
+        last = profile_tagged[#profile_tagged]
+    end
+end
+
+function profile_end(name)
+    if not name then
+        return
+    end
+    local now = minetest.get_us_time()
+    local depth = #profile_names
+    while depth > 0 and profile_names[depth] ~= name do
+        depth = depth - 1
+    end
+    if depth == 0 then
+        profile_write(string.format("Profiling not started: %s", name))
+        return
+    end
+    -- Calls skipped by 'profile_sample' only hold the calls made inside them
+    if profile_weights[depth] == 0 then
+        local nested = profile_nested[depth]
+        profile_pop(depth)
+        if #profile_tagged > 0 then
+            profile_add_breakdown(name, 0, 0, 0, depth)
+        end
+        if nested and profile_interval == nil then
+            if depth > 1 then
+                profile_nested[depth - 1] = true
+            end
+            profile_write(string.format("%s 0 %d 0 0 %s", name, depth - 1, profile_environment))
+        end
+        if profile_memory then
+            profile_memory_used = collectgarbage("count")
+        end
+        return
+    end
+    local start = profile_times[depth]
+    local time = now - start
+    local weight = profile_weights[depth]
+    local path = profile_paths[depth]
+    local children = profile_children[depth]
+    local allocated, self_allocated, freed
+    if profile_memory then
+        profile_update_memory()
+        allocated = (profile_allocated - profile_start_allocated[depth]) * 1024
+        self_allocated = allocated - profile_children_allocated[depth]
+        freed = (profile_freed - profile_start_freed[depth]) * 1024
+        if depth > 1 then
+            profile_children_allocated[depth - 1] = profile_children_allocated[depth - 1] +
+                allocated * weight
+        end
+    end
+    -- Calls left without 'profile_end' inside this one, e.g. by an error, are
+    -- discarded
+    profile_pop(depth)
+    if depth > 1 then
+        profile_children[depth - 1] = profile_children[depth - 1] + time * weight
+        profile_nested[depth - 1] = true
+    end
+    if #profile_tagged > 0 then
+        profile_add_breakdown(name, time, children, weight, depth)
+    end
+
+    if profile_interval == nil then
+        local line = string.format("%s %d %d %d %d %s", name, time, depth - 1, weight, start,
+            profile_environment)
+        if profile_memory then
+            line = line .. string.format(" %d %d", allocated, freed)
+        end
+        profile_write(line)
+    else
+        local stats = profile_stats[path]
+        if stats == nil then
+            stats = {count = 0, total = 0, self = 0, min = time, max = time, buckets = {},
+                allocated = 0, self_allocated = 0, freed = 0}
+            profile_stats[path] = stats
+        end
+        if profile_memory then
+            stats.allocated = stats.allocated + allocated * weight
+            stats.self_allocated = stats.self_allocated + self_allocated * weight
+            stats.freed = stats.freed + freed * weight
+        end
+        stats.count = stats.count + weight
+        stats.total = stats.total + time * weight
+        stats.self = stats.self + (time - children) * weight
+        stats.min = math.min(stats.min, time)
+        stats.max = math.max(stats.max, time)
+        local bucket = -1
+        if time >= 1 then
+            bucket = math.floor(math.log(time) / profile_log2 * 8 + 1e-9)
+        end
+        stats.buckets[bucket] = (stats.buckets[bucket] or 0) + weight
+    end
+    if depth == 1 and now - profile_last_summary >= (profile_interval or 1) * 1e+6 then
+        profile_print_summary()
+        profile_last_summary = now
+    end
+    if profile_memory then
+        profile_memory_used = collectgarbage("count")
+    end
+end
+
+-- Ends a call like 'profile_end' and returns all other arguments, so that
+-- 'return f(x)' can be profiled as 'return profile_return(name, f(x))'
+function profile_return(name, ...)
+    profile_end(name)
+    return ...
+end
+
+if minetest.register_on_shutdown then
+    minetest.register_on_shutdown(profile_print_summary)
 end
 
 function int_hash(value)
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+
+# This is a Python script
+# It compares the running time of the vertex welding and coplanar face merging
+# stages in 'convert.py' against their original implementations, which used
+# a dictionary of vertices and an all-pairs comparison, on every model
+# under 'mods/*/models/*.scad' and on synthetic meshes, and checks that both
+# produce the same polygons. It then measures polygon re-triangulation, and
+# compares the available UV packing algorithms in speed, texture size and fill
+# ratio.
+
+# It requires OpenSCAD to read the '.scad' files; if it's not available, the
+# triangles are read back from the '.obj' files generated from them instead.
+# Run it from any directory with: 'python3 benchmark.py'. The all-pairs
+# implementation is quadratic, so it's skipped on meshes larger than the value
+# of '--legacy-limit' (5000 triangles by default); likewise, the grid packer is
+# skipped on meshes with more polygons than '--grid-limit' (100 by default).
+
+import argparse, glob, os, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import numpy as np
+import convert
+
+# Original implementation of 'convert.weld_vertices', kept for comparison
+def index_vertices_legacy(triangles):
+    vertices = []
+    global_vertex_indices = {}
+    for triangle in triangles:
+        for vertex in triangle:
+            if vertex not in global_vertex_indices:
+                global_vertex_indices[vertex] = len(vertices)
+                vertices.append(vertex)
+    return vertices, global_vertex_indices
+
+def is_coplanar_legacy(triangle1, triangle2):
+    candidate_quad = tuple(set(triangle1).union(set(triangle2)))
+    M = tuple(map(lambda x: \
+        tuple(map(lambda y: y[0] - y[1], zip(x, candidate_quad[0]))), candidate_quad[1:] \
+    ))
+    det = sum([M[0][n%3]*(M[1][(n+1)%3]*M[2][(n+2)%3] - M[1][(n+2)%3]*M[2][(n+1)%3]) \
+        for n in range(0, 3) \
+    ])
+    return abs(det) < 0.0001
+
+# Original implementation of 'convert.merge_coplanar', kept for comparison
+def merge_coplanar_legacy(triangles):
+    tris_to_polys = [None for n in range(len(triangles))]
+    polys_to_tris = []
+
+    for n1 in range(len(triangles)):
+        if tris_to_polys[n1] is None:
+            tris_to_polys[n1] = len(polys_to_tris)
+            polys_to_tris.append([])
+            polys_to_tris[-1].append(n1)
+        for n2 in range(n1 + 1, len(triangles)):
+            if tris_to_polys[n2] == tris_to_polys[n1]:
+                continue
+            if len(set(triangles[n1]).intersection(set(triangles[n2]))) == 2:
+                if is_coplanar_legacy(triangles[n1], triangles[n2]):
+                    if tris_to_polys[n2] is not None:
+                        removed_p = tris_to_polys[n2]
+                        for t in polys_to_tris[removed_p]:
+                            tris_to_polys[t] = tris_to_polys[n1]
+                            polys_to_tris[tris_to_polys[n1]].append(t)
+                        del polys_to_tris[removed_p]
+                        for t_list in polys_to_tris[removed_p :]:
+                            for t in t_list:
+                                tris_to_polys[t] -= 1
+                    else:
+                        tris_to_polys[n2] = tris_to_polys[n1]
+                        polys_to_tris[tris_to_polys[n1]].append(n2)
+    return polys_to_tris
+
+def read_obj(filename):
+    vertices = []
+    triangles = []
+    with open(filename, "rt") as file:
+        for line in file:
+            fields = line.split()
+            if len(fields) == 0:
+                continue
+            if fields[0] == "v":
+                vertices.append(tuple(map(float, fields[1:4])))
+            elif fields[0] == "f":
+                triangles.append([vertices[int(f.split("/")[0]) - 1] for f in fields[1:4]])
+    return np.array(triangles, dtype=np.float64).reshape(-1, 3, 3)
+
+def read_scad(filename):
+    with tempfile.TemporaryDirectory() as directory:
+        stl = os.path.join(directory, "model.stl")
+        if convert.export_scad(filename, stl):
+            return convert.read_stl(stl)
+    obj = filename[:-len(".scad")] + ".obj"
+    print("Could not run OpenSCAD, reading {} instead".format(os.path.basename(obj)))
+    return read_obj(obj)
+
+# Generates a terraced terrain of 'side' x 'side' cells, made up of horizontal
+# squares at different heights joined by vertical walls; every square and wall
+# is split in two triangles
+def synthetic_terrain(side):
+    height = lambda x, y: ((x // 5) * 7 + (y // 3) * 13) % 4 / 16
+    quad = lambda a, b, c, d: [[a, b, c], [a, c, d]]
+    triangles = []
+    for x in range(side):
+        for y in range(side):
+            h = height(x, y)
+            x0, y0, x1, y1 = x / 16, y / 16, (x + 1) / 16, (y + 1) / 16
+            triangles += quad((x0, y0, h), (x1, y0, h), (x1, y1, h), (x0, y1, h))
+            if x + 1 < side and height(x + 1, y) != h:
+                h1 = height(x + 1, y)
+                triangles += quad((x1, y0, h), (x1, y1, h), (x1, y1, h1), (x1, y0, h1))
+            if y + 1 < side and height(x, y + 1) != h:
+                h1 = height(x, y + 1)
+                triangles += quad((x0, y1, h), (x1, y1, h), (x1, y1, h1), (x0, y1, h1))
+    return np.array(triangles, dtype=np.float64)
+
+def time_call(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+def time_format(n):
+    if n > 0.5:
+        return "{:.2f} s".format(n)
+    elif n > 0.5e-3:
+        return "{:.2f} ms".format(n*1e+3)
+    return "{:.2f} us".format(n*1e+6)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark model conversion stages")
+    parser.add_argument("--legacy-limit", type=int, default=5000,
+        help="largest triangle count to run the all-pairs implementation on")
+    parser.add_argument("--grid-limit", type=int, default=100,
+        help="largest polygon count to run the grid packer on")
+    parser.add_argument("--side", type=int, nargs="*", default=[20, 40, 200],
+        help="sides of the synthetic terrain meshes; 200 gives ~100k triangles")
+    args = parser.parse_args()
+
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+    meshes = []
+    for filename in sorted(glob.glob(os.path.join(root, "mods", "*", "models", "*.scad"))):
+        meshes.append((os.path.basename(filename), read_scad(filename)))
+    for side in args.side:
+        meshes.append(("terrain {0}x{0}".format(side), synthetic_terrain(side)))
+
+    print("NAME" + (32-4)*" " + "TRIANGLES" + (12-9)*" " + "VERTICES" + (16-8)*" " +\
+    "POLYGONS" + (12-8)*" " + "WELD (DICT)" + (16-11)*" " + "WELD (NUMPY)" + (16-12)*" " +\
+    "MERGE (LEGACY)" + (16-14)*" " + "MERGE (EDGE-INDEXED)")
+    welded_meshes = []
+    mesh_polys = []
+    for name, triangles in meshes:
+        tuples = [list(map(tuple, triangle)) for triangle in triangles.tolist()]
+        (legacy_vertices, legacy_indices), legacy_weld_time = time_call(index_vertices_legacy, tuples)
+        (vertices, indices), weld_time = time_call(convert.weld_vertices, triangles)
+        welded_meshes.append((vertices, indices))
+        polys, merge_time = time_call(convert.merge_coplanar, vertices, indices)
+        mesh_polys.append(polys)
+        legacy_merge_time = "-"
+        if len(triangles) <= args.legacy_limit:
+            welded = [list(map(tuple, triangle)) for triangle in vertices[indices].tolist()]
+            legacy_polys, legacy_merge_time = time_call(merge_coplanar_legacy, welded)
+            legacy_merge_time = time_format(legacy_merge_time)
+            if legacy_polys != polys:
+                print("{}: polygons differ from the legacy implementation".format(name))
+                sys.exit(1)
+        print("{:<32s}{:<12d}{:<16s}{:<12d}{:<16s}{:<16s}{:<16s}{:s}".format(name, len(triangles),
+        "{} -> {}".format(len(legacy_vertices), len(vertices)), len(polys),
+        time_format(legacy_weld_time), time_format(weld_time), legacy_merge_time,
+        time_format(merge_time)))
+
+    print()
+    print("NAME" + (32-4)*" " + "TRIANGLES" + (20-9)*" " + "VERTICES" + (20-8)*" " + "SIMPLIFY")
+    for name, (vertices, indices), polys in zip([name for name, triangles in meshes],
+    welded_meshes, mesh_polys):
+        (new_vertices, new_indices, new_polys), simplify_time = time_call(
+            convert.simplify_polygons, vertices, indices, polys
+        )
+        print("{:<32s}{:<20s}{:<20s}{:s}".format(name,
+        "{} -> {}".format(len(indices), len(new_indices)),
+        "{} -> {}".format(len(vertices), len(new_vertices)), time_format(simplify_time)))
+
+    packers = list(convert.packers.keys())
+    print()
+    print("NAME" + (32-4)*" " + "POLYGONS" + (12-8)*" " +\
+    "".join(["{:<36s}".format(packer.upper()) for packer in packers]))
+    for name, (vertices, indices), polys in zip([name for name, triangles in meshes],
+    welded_meshes, mesh_polys):
+        poly_minima, poly_maxima = convert.bounding_boxes(vertices, indices, polys)
+        columns = []
+        for packer in packers:
+            if packer == "grid" and len(polys) > args.grid_limit:
+                columns.append("-")
+                continue
+            (uvrectangles, maxside), pack_time = time_call(
+                convert.pack_uvs, poly_minima, poly_maxima, packer
+            )
+            columns.append("{0} x {0}, {1:.1f}%, {2}".format(maxside,
+            100 * convert.fill_ratio(uvrectangles, maxside), time_format(pack_time)))
+        print("{:<32s}{:<12d}".format(name, len(polys)) +\
+        "".join(["{:<36s}".format(column) for column in columns]))
+
+if __name__ == "__main__":
+    main()
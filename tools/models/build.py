@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+
+# This is a Python script
+# It generates Wavefront OBJ model files from all OpenSCAD scripts in the game,
+# that is, 'mods/*/models/*.scad'. Each '.obj' file is written next to the
+# '.scad' file it comes from, and the size of the texture it needs is printed.
+
+# It requires OpenSCAD, which you can install from your system's repositories,
+# e.g. sudo apt-get install openscad, or download from https://openscad.org/
+# It also requires Python 3 with NumPy, e.g. sudo apt-get install python3-numpy
+
+# Run it from any directory with: 'python3 tools/models/build.py'. Models are
+# built in parallel, one per CPU core by default. To build only some of them,
+# pass their mod names or '.scad' file paths, e.g.
+# 'python3 tools/models/build.py nv_ships mods/nv_ores/models/nv_furnace1.scad'
+
+# With '--atlas', the textures of all models built are packed into one, see
+# 'README.md'
+
+# Exported meshes and converted models are kept in a cache (see 'cache.py'), so
+# unchanged models are not exported or converted again. Use '--list-cache' and
+# '--prune-cache' to inspect it and to delete entries no current model uses.
+
+import argparse, concurrent.futures, glob, os, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import cache, convert
+
+root = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+# Returns the '.scad' files selected by the given mod names or file paths, or
+# all of them if none are given
+def find_models(selection):
+    models = sorted(glob.glob(os.path.join(root, "mods", "*", "models", "*.scad")))
+    if len(selection) == 0:
+        return models
+    selected = []
+    for item in selection:
+        if item.endswith(".scad"):
+            selected.append(os.path.abspath(item))
+        else:
+            mod_models = [m for m in models if os.path.basename(os.path.dirname(os.path.dirname(m))) == item]
+            if len(mod_models) == 0:
+                print("No models found for '{}'".format(item))
+            selected += mod_models
+    return selected
+
+# Exports and converts a single model, unless it's cached; this runs in a
+# worker process. The mesh is read from OpenSCAD through a pipe, and vertices
+# are welded as it arrives. Returns None if the export fails, or the time taken
+# by each step, the texture size and fill ratio, and which steps were cached
+def build_model(scad_filename, options, cache_directory):
+    obj_filename = scad_filename[:-len(".scad")] + ".obj"
+    convert_options = {key: value for key, value in options.items() if key != "tolerance"}
+    boxes_filename = convert.boxes_filename(obj_filename) if "max_boxes" in options else None
+    export_time, convert_time = 0, 0
+    if cache_directory is not None:
+        mesh = cache.mesh_key(scad_filename)
+        model = cache.model_key(mesh, options)
+        texture = cache.get_model(cache_directory, model, obj_filename, boxes_filename)
+        if texture is not None:
+            return export_time, convert_time, texture, "cached"
+        stl_filename = cache.get_mesh(cache_directory, mesh)
+        if stl_filename is not None:
+            start = time.perf_counter()
+            texture = convert.convert(stl_filename, obj_filename, **options)
+            convert_time = time.perf_counter() - start
+            cache.put_model(cache_directory, model, scad_filename, obj_filename, texture,
+                boxes_filename)
+            return export_time, convert_time, texture, "converted"
+
+    start = time.perf_counter()
+    welded = export_and_weld(scad_filename, options["tolerance"],
+        mesh if cache_directory is not None else None, cache_directory)
+    if welded is None:
+        return None
+    export_time = time.perf_counter() - start
+    start = time.perf_counter()
+    vertices, indices, edges = welded
+    texture = convert.convert_mesh(vertices, indices, obj_filename, edges=edges, **convert_options)
+    convert_time = time.perf_counter() - start
+    if cache_directory is not None:
+        cache.put_model(cache_directory, model, scad_filename, obj_filename, texture, boxes_filename)
+    return export_time, convert_time, texture, "built"
+
+# Streams a model from OpenSCAD into the vertex welding stage, also writing it
+# to the cache if a key is given; returns the vertices, indices and edges, or
+# None if the export fails. OpenSCAD versions that can't write to a pipe are
+# run on a temporary file instead
+def export_and_weld(scad_filename, tolerance, mesh, cache_directory):
+    try:
+        process = convert.export_scad_stream(scad_filename)
+    except FileNotFoundError:
+        return None
+    copy = cache.begin_mesh(cache_directory, mesh) if mesh is not None else None
+    welded = convert.weld_stream(convert.iter_stl(process.stdout, copy), tolerance)
+    process.stdout.close()
+    success = process.wait() == 0 and len(welded[1]) > 0
+    if copy is not None:
+        cache.finish_mesh(cache_directory, mesh, scad_filename, copy, success)
+    if success:
+        return welded
+
+    with tempfile.TemporaryDirectory() as directory:
+        stl_filename = os.path.join(directory, "mesh.stl")
+        if not convert.export_scad(scad_filename, stl_filename):
+            return None
+        if mesh is not None:
+            cache.put_mesh(cache_directory, mesh, scad_filename, stl_filename)
+        vertices, indices = convert.weld_vertices(convert.read_stl(stl_filename), tolerance)
+    return vertices, indices, None
+
+# Prints all cache entries
+def list_cache(cache_directory):
+    print("KIND" + (12-4)*" " + "KEY" + (20-3)*" " + "MODEL" + (32-5)*" " + "SIZE" + (12-4)*" " +\
+    "LAST USED")
+    for kind, key, info, size, used in cache.entries(cache_directory):
+        name = info["name"] if info is not None else "(incomplete)"
+        print("{:<12s}{:<20s}{:<32s}{:<12s}{:s}".format(kind, key[:16], name,
+        "{:.1f} kB".format(size / 1e+3), time.strftime("%Y-%m-%d %H:%M", time.localtime(used))))
+
+# Deletes cache entries not used by any model with the current options
+def prune_cache(cache_directory, options):
+    keep = set()
+    for model in find_models([]):
+        mesh = cache.mesh_key(model)
+        keep.add(mesh)
+        keep.add(cache.model_key(mesh, options))
+    removed = cache.prune(cache_directory, keep)
+    print("Removed {} entries, {:.1f} kB".format(len(removed), sum(entry[3] for entry in removed) / 1e+3))
+
+def time_format(n):
+    if n > 0.5:
+        return "{:.2f} s".format(n)
+    return "{:.2f} ms".format(n*1e+3)
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate OBJ models from OpenSCAD scripts")
+    parser.add_argument("models", nargs="*",
+        help="mod names or '.scad' files to build; all models by default")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+        help="number of models to build at the same time")
+    parser.add_argument("--cache-dir", default=cache.default_directory,
+        help="directory where exported meshes and converted models are kept")
+    parser.add_argument("--no-cache", action="store_true",
+        help="export and convert all models, without reading or writing the cache")
+    parser.add_argument("--list-cache", action="store_true",
+        help="list all cache entries and exit")
+    parser.add_argument("--prune-cache", action="store_true",
+        help="delete cache entries not used by any model with the given options and exit")
+    convert.add_arguments(parser)
+    args = parser.parse_args()
+    options = {"packer": args.packer, "tolerance": args.tolerance, "simplify": args.simplify}
+    if args.max_boxes > 0:
+        options.update(max_boxes=args.max_boxes, box_tolerance=args.box_tolerance)
+    cache_directory = None if args.no_cache else args.cache_dir
+
+    if args.list_cache:
+        list_cache(args.cache_dir)
+        return
+    if args.prune_cache:
+        prune_cache(args.cache_dir, options)
+        return
+
+    models = find_models(args.models)
+    start = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        futures = {
+            executor.submit(build_model, model, options, cache_directory): model
+            for model in models
+        }
+        results = {}
+        for future in concurrent.futures.as_completed(futures):
+            model = futures[future]
+            # A model that can't be converted fails on its own, and the others
+            # are still built
+            try:
+                results[model] = future.result()
+            except Exception as e:
+                results[model] = None
+                print("Failed to convert {}: {}: {}".format(os.path.relpath(model, root),
+                    type(e).__name__, e))
+                continue
+            print("Built {}".format(os.path.relpath(model, root)) if results[model] is not None \
+            else "Failed to export {}".format(os.path.relpath(model, root)))
+    total_time = time.perf_counter() - start
+
+    print()
+    print("MODEL" + (48-5)*" " + "STATUS" + (12-6)*" " + "EXPORT" + (12-6)*" " +\
+    "CONVERT" + (12-7)*" " + "TEXTURE")
+    failed = 0
+    for model in models:
+        name = os.path.relpath(model, root)
+        if results[model] is None:
+            print("{:<48s}{:s}".format(name, "failed"))
+            failed += 1
+            continue
+        export_time, convert_time, texture, status = results[model]
+        print("{:<48s}{:<12s}{:<12s}{:<12s}{:s}".format(name, status, time_format(export_time),
+        time_format(convert_time), convert.texture_format(*texture)))
+    print("Built {} models in {} using {} jobs".format(len(models) - failed,
+        time_format(total_time), args.jobs))
+    if failed > 0:
+        print("Failed to build {} models".format(failed))
+    if args.atlas is not None:
+        built = [(model[:-len(".scad")] + ".obj", *results[model][2])
+            for model in models if results[model] is not None]
+        atlas = convert.build_atlas(built, args.atlas, args.packer)
+        if atlas is None:
+            print("No models built, so no atlas was made")
+        else:
+            print("Atlas {}: {}".format(args.atlas, convert.texture_format(*atlas)))
+    if failed > 0:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
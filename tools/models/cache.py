@@ -0,0 +1,173 @@
+# This is a Python module
+# It implements the build cache used by 'build.py'. Entries are named after a
+# hash of everything that affects them, so they never need to be invalidated;
+# stale entries just stop being used, and can be pruned.
+
+# There are two kinds of entries:
+# * Meshes, which hold the STL file exported by OpenSCAD, keyed on the '.scad'
+#   file and all files it includes or uses.
+# * Models, which hold the final OBJ file, its collision boxes if requested, and
+#   the texture size printed for it, keyed on the mesh, the converter's source
+#   code and the conversion options.
+
+import hashlib, json, os, re, shutil, time
+
+default_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+
+re_dependency = re.compile(r"^\s*(?:include|use)\s*<([^>]+)>", re.MULTILINE)
+
+converter_filename = os.path.join(os.path.dirname(os.path.abspath(__file__)), "convert.py")
+
+# Returns the paths of a '.scad' file and all files it includes or uses,
+# recursively; missing files are listed too, so that creating them later
+# changes the key
+def dependencies(scad_filename, found=None):
+    if found is None:
+        found = []
+    scad_filename = os.path.normpath(scad_filename)
+    if scad_filename in found:
+        return found
+    found.append(scad_filename)
+    if os.path.isfile(scad_filename):
+        with open(scad_filename, "rt") as file:
+            for name in re_dependency.findall(file.read()):
+                dependencies(os.path.join(os.path.dirname(scad_filename), name), found)
+    return found
+
+def hash_files(filenames, digest):
+    for filename in filenames:
+        digest.update(os.path.basename(filename).encode() + b"\0")
+        if os.path.isfile(filename):
+            with open(filename, "rb") as file:
+                digest.update(file.read())
+        digest.update(b"\0")
+
+# Returns the key of the mesh exported from a '.scad' file
+def mesh_key(scad_filename):
+    digest = hashlib.sha256(b"mesh\0")
+    hash_files(dependencies(scad_filename), digest)
+    return digest.hexdigest()
+
+# Returns the key of the model converted from a mesh with the given options
+def model_key(mesh, options):
+    digest = hashlib.sha256(b"model\0" + mesh.encode() + b"\0")
+    hash_files([converter_filename], digest)
+    digest.update(json.dumps(options, sort_keys=True).encode())
+    return digest.hexdigest()
+
+def entry_path(directory, kind, key):
+    return os.path.join(directory, kind, key)
+
+# Looks up a cached mesh; returns the path to its STL file, or None
+def get_mesh(directory, key):
+    path = entry_path(directory, "meshes", key)
+    if not os.path.isfile(os.path.join(path, "info.json")):
+        return None
+    touch(path)
+    return os.path.join(path, "mesh.stl")
+
+def put_mesh(directory, key, scad_filename, stl_filename):
+    store(directory, "meshes", key, {"name": os.path.basename(scad_filename)},
+        {"mesh.stl": stl_filename})
+
+# Starts writing a mesh into the cache; returns a file to write the STL data to
+def begin_mesh(directory, key):
+    return open(os.path.join(begin_entry(directory, "meshes", key), "mesh.stl"), "wb")
+
+# Adds a mesh written through 'begin_mesh' to the cache, or discards it
+def finish_mesh(directory, key, scad_filename, file, success=True):
+    file.close()
+    temporary = os.path.dirname(file.name)
+    if success:
+        finish_entry(directory, "meshes", key, temporary, {"name": os.path.basename(scad_filename)})
+    else:
+        shutil.rmtree(temporary)
+
+# Looks up a cached model; if found, copies its OBJ file to 'obj_filename', and
+# its collision boxes to 'boxes_filename' if given, and returns the texture
+# size and fill ratio
+def get_model(directory, key, obj_filename, boxes_filename=None):
+    path = entry_path(directory, "models", key)
+    try:
+        with open(os.path.join(path, "info.json"), "rt") as file:
+            info = json.load(file)
+    except FileNotFoundError:
+        return None
+    shutil.copyfile(os.path.join(path, "model.obj"), obj_filename)
+    if boxes_filename is not None:
+        shutil.copyfile(os.path.join(path, "boxes.lua"), boxes_filename)
+    touch(path)
+    return tuple(info["texture"])
+
+def put_model(directory, key, scad_filename, obj_filename, texture, boxes_filename=None):
+    files = {"model.obj": obj_filename}
+    if boxes_filename is not None:
+        files["boxes.lua"] = boxes_filename
+    store(directory, "models", key, {"name": os.path.basename(scad_filename), "texture": texture},
+        files)
+
+# Creates a temporary directory where the files of an entry can be written,
+# before calling 'finish_entry'
+def begin_entry(directory, kind, key):
+    path = entry_path(directory, kind, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = "{}.{}.tmp".format(path, os.getpid())
+    os.makedirs(temporary, exist_ok=True)
+    return temporary
+
+# Adds the entry's information and renames its temporary directory, so that
+# concurrent builds never see a partial entry
+def finish_entry(directory, kind, key, temporary, info):
+    info["created"] = time.time()
+    with open(os.path.join(temporary, "info.json"), "wt") as file:
+        json.dump(info, file)
+    try:
+        os.rename(temporary, entry_path(directory, kind, key))
+    except OSError:
+        shutil.rmtree(temporary)
+
+def store(directory, kind, key, info, files):
+    if os.path.isdir(entry_path(directory, kind, key)):
+        return
+    temporary = begin_entry(directory, kind, key)
+    for name, source in files.items():
+        shutil.copyfile(source, os.path.join(temporary, name))
+    finish_entry(directory, kind, key, temporary, info)
+
+# Records that an entry was used, in the modification time of its directory
+def touch(path):
+    os.utime(path)
+
+# Returns all entries as (kind, key, info, size, last use time) tuples
+def entries(directory):
+    result = []
+    for kind in ("meshes", "models"):
+        kind_directory = os.path.join(directory, kind)
+        if not os.path.isdir(kind_directory):
+            continue
+        for key in sorted(os.listdir(kind_directory)):
+            path = os.path.join(kind_directory, key)
+            try:
+                with open(os.path.join(path, "info.json"), "rt") as file:
+                    info = json.load(file)
+            except (FileNotFoundError, NotADirectoryError, ValueError):
+                info = None
+            size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)) \
+                if os.path.isdir(path) else os.path.getsize(path)
+            result.append((kind, key, info, size, os.path.getmtime(path)))
+    return result
+
+# Deletes all entries whose key is not in 'keep'; returns the deleted
+# entries
+def prune(directory, keep):
+    removed = []
+    for entry in entries(directory):
+        kind, key = entry[0], entry[1]
+        if key not in keep:
+            path = entry_path(directory, kind, key)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+            removed.append(entry)
+    return removed
@@ -0,0 +1,1119 @@
+#!/usr/bin/env python3
+
+# This is a Python script
+# It takes an STL file name (without extension) as input, and produces an OBJ
+# file in the same directory; both ASCII and binary STL files are supported.
+# With '--stdin', the STL data is read from standard input as it arrives, e.g.
+# 'openscad -o - --export-format binstl model.scad | convert.py --stdin model'
+# Several names can be given at once, e.g. to share a texture atlas ('--atlas')
+
+# It's usually run through 'build.py', which also exports the STL files from
+# OpenSCAD, but it can also be imported as a module, in which case each stage
+# of the conversion is available separately
+
+import argparse, array, bisect, json, math, mmap, os, subprocess, sys, re
+import numpy as np
+
+vertex_pattern = re.compile(rb"vertex\s+(\S+)\s+(\S+)\s+(\S+)")
+
+# Binary STL files have an 80-byte header and a 32-bit triangle count, followed
+# by one 50-byte record per triangle: a normal vector and three vertices, each
+# made of three 32-bit floats, and a 16-bit attribute field
+binary_header_size = 84
+binary_record_size = 50
+
+# Returns the number of triangles in a binary STL file, or None if the file is
+# in ASCII format
+def binary_stl_count(file):
+    size = os.fstat(file.fileno()).st_size
+    if size < binary_header_size:
+        return None
+    file.seek(80)
+    count = int.from_bytes(file.read(4), "little")
+    file.seek(0)
+    if size != binary_header_size + binary_record_size * count:
+        return None
+    return count
+
+# Decodes all vertex coordinates of a binary STL file in bulk, by mapping it to
+# memory and copying the vertex fields out of every record as 16-bit words
+def read_binary_stl(file, count):
+    coordinates = array.array("f")
+    if count == 0:
+        return coordinates
+    vertex_data = bytearray(36 * count)
+    with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        with memoryview(data) as view:
+            records = view[binary_header_size:].cast("H")
+            vertex_words = memoryview(vertex_data).cast("H")
+            for n in range(18):
+                vertex_words[n::18] = records[6 + n::binary_record_size // 2]
+            vertex_words.release()
+            records.release()
+    coordinates.frombytes(vertex_data)
+    if sys.byteorder == "big":
+        coordinates.byteswap()
+    return coordinates
+
+def read_ascii_stl(file):
+    matches = vertex_pattern.findall(file.read())
+    return array.array("d", map(float, (c for vertex in matches for c in vertex)))
+
+# Reads an STL file, either binary or ASCII, and returns a packed array with
+# nine coordinates per triangle
+def read_stl_coordinates(filename):
+    with open(filename, "rb") as file:
+        count = binary_stl_count(file)
+        if count is not None:
+            return read_binary_stl(file, count)
+        return read_ascii_stl(file)
+
+# Reads an STL file and returns an array of triangles, with shape (T, 3, 3)
+def read_stl(filename):
+    coordinates = read_stl_coordinates(filename)
+    return np.frombuffer(coordinates, dtype=coordinates.typecode) \
+        .astype(np.float64).reshape(-1, 3, 3)
+
+# Number of triangles read at once when reading an STL stream
+stream_chunk_size = 4096
+
+binary_record_dtype = np.dtype([
+    ("normal", "<f4", (3,)),
+    ("vertices", "<f4", (3, 3)),
+    ("attribute", "<u2"),
+])
+
+# Reads an STL file from a binary stream, such as a pipe, as it arrives;
+# yields arrays of triangles with shape (k, 3, 3). If 'copy' is given, all
+# data read is also written to it
+def iter_stl(stream, copy=None):
+    def read(size):
+        data = stream.read(size)
+        if copy is not None:
+            copy.write(data)
+        return data
+
+    data = read(binary_header_size)
+    if data.startswith(b"solid"):
+        # Binary headers may also start with 'solid', so look further
+        data += read(512)
+        if b"facet" in data or b"endsolid" in data or len(data) < binary_header_size:
+            yield from iter_ascii_stl(data, read)
+            return
+    if len(data) < binary_header_size:
+        return
+    remaining = int.from_bytes(data[80:84], "little")
+    data = data[binary_header_size:]
+    while remaining > 0:
+        count = min(remaining, stream_chunk_size)
+        data += read(count * binary_record_size - len(data))
+        count = min(count, len(data) // binary_record_size)
+        if count == 0:
+            return
+        records = np.frombuffer(data, dtype=binary_record_dtype, count=count)
+        yield records["vertices"].astype(np.float64)
+        data = data[count * binary_record_size:]
+        remaining -= count
+
+def iter_ascii_stl(data, read):
+    coordinates = []
+    while True:
+        block = read(65536)
+        data += block
+        end = len(data) if len(block) == 0 else data.rfind(b"\n") + 1
+        for vertex in vertex_pattern.findall(data, 0, end):
+            coordinates += vertex
+        data = data[end:]
+        complete = len(coordinates) - len(coordinates) % 9
+        if complete >= 9 * stream_chunk_size or len(block) == 0 and complete > 0:
+            yield np.array(coordinates[:complete], dtype=np.float64).reshape(-1, 3, 3)
+            del coordinates[:complete]
+        if len(block) == 0:
+            return
+
+# Returns the values that identify welded vertices, with shape (V, 3)
+def weld_keys(positions, tolerance):
+    if tolerance > 0:
+        return np.round(positions / tolerance).astype(np.int64)
+    return positions + 0.0 # Turns -0.0 into 0.0
+
+# Welds together vertices closer than 'tolerance' along every axis, by snapping
+# them to a grid of that size; returns the distinct vertices, in order of first
+# appearance and at their first position, and an array of vertex indices with
+# shape (T, 3). A 'tolerance' of 0 only welds identical vertices
+def weld_vertices(triangles, tolerance=1e-5):
+    positions = triangles.reshape(-1, 3)
+    keys = weld_keys(positions, tolerance)
+    # Rank coordinates along each axis, and combine the ranks into one integer
+    # per vertex, which is much faster to sort than rows of three
+    combined = np.zeros(len(keys), dtype=np.int64)
+    for axis in range(3):
+        axis_values, axis_ranks = np.unique(keys[:, axis], return_inverse=True)
+        combined = combined * len(axis_values) + axis_ranks.reshape(-1)
+    unique_keys, first, inverse = np.unique(combined, return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    ranks = np.empty_like(order)
+    ranks[order] = np.arange(len(order))
+    vertices = positions[first[order]]
+    indices = ranks[inverse.reshape(-1)].reshape(-1, 3)
+    return vertices, indices
+
+# Like 'weld_vertices', but takes triangles in chunks, as they are read, and
+# also finds the edges of each chunk; returns the vertices, indices and edges
+# of the whole mesh, the latter as returned by 'triangle_edges'
+def weld_stream(chunks, tolerance=1e-5):
+    key_indices = {}
+    vertex_chunks = []
+    index_chunks = []
+    edge_chunks = []
+    vertex_count = 0
+    triangle_count = 0
+    for triangles in chunks:
+        positions = triangles.reshape(-1, 3)
+        keys = np.ascontiguousarray(weld_keys(positions, tolerance))
+        keys = keys.view(np.dtype((np.void, keys.dtype.itemsize * 3))).reshape(-1)
+        unique_keys, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        # Look up each distinct vertex of the chunk, in order of appearance
+        chunk_indices = np.empty(len(unique_keys), dtype=np.int64)
+        new = []
+        for u in np.argsort(first).tolist():
+            key = unique_keys[u].tobytes()
+            index = key_indices.get(key)
+            if index is None:
+                index = key_indices[key] = vertex_count + len(new)
+                new.append(first[u])
+            chunk_indices[u] = index
+        vertex_chunks.append(positions[new])
+        vertex_count += len(new)
+        indices = chunk_indices[inverse.reshape(-1)].reshape(-1, 3)
+        index_chunks.append(indices)
+        edge_chunks.append(triangle_edges(indices, triangle_count))
+        triangle_count += len(indices)
+    if triangle_count == 0:
+        return np.empty((0, 3)), np.empty((0, 3), dtype=np.int64), triangle_edges(np.empty((0, 3), dtype=np.int64))
+    return np.concatenate(vertex_chunks), np.concatenate(index_chunks), \
+        tuple(map(np.concatenate, zip(*edge_chunks)))
+
+# Returns all edges of non-degenerate triangles, as sorted pairs of vertex
+# indices, along with the index of the triangle each comes from; 'offset' is
+# added to the latter
+def triangle_edges(indices, offset=0):
+    degenerate = (indices[:, 0] == indices[:, 1]) | (indices[:, 1] == indices[:, 2]) \
+        | (indices[:, 2] == indices[:, 0])
+    edges = np.stack([indices, np.roll(indices, -1, axis=1)], axis=2).reshape(-1, 2)
+    edges.sort(axis=1)
+    edge_tris = np.repeat(np.arange(offset, offset + len(indices)), 3)
+    valid = ~np.repeat(degenerate, 3)
+    return edges[valid], edge_tris[valid]
+
+# Finds all pairs of triangles (n1, n2), with n1 < n2, that share exactly one
+# edge and are coplanar; returns them sorted by n1 and then n2. The result of
+# 'triangle_edges' can be passed if already known
+def coplanar_pairs(vertices, indices, edges=None):
+    if edges is None:
+        edges = triangle_edges(indices)
+    edges, edge_tris = edges
+    order = np.lexsort((edge_tris, edges[:, 1], edges[:, 0]))
+    edges, edge_tris = edges[order], edge_tris[order]
+
+    # Triangles around the same edge are now contiguous; pair each of them
+    # with all the others, one distance at a time
+    pairs = []
+    distance = 1
+    while distance < len(edges):
+        same = (edges[distance:] == edges[:-distance]).all(axis=1)
+        if not same.any():
+            break
+        pairs.append(np.stack([edge_tris[:-distance][same], edge_tris[distance:][same]], axis=1))
+        distance += 1
+    if len(pairs) == 0:
+        return np.empty((0, 2), dtype=np.int64)
+    pairs = np.unique(np.concatenate(pairs), axis=0)
+
+    # Triangles with the same three vertices share all three edges
+    sorted_indices = np.sort(indices, axis=1)
+    pairs = pairs[(sorted_indices[pairs[:, 0]] != sorted_indices[pairs[:, 1]]).any(axis=1)]
+
+    # Check that the fourth vertex lies on the plane of the first triangle
+    tri1, tri2 = indices[pairs[:, 0]], indices[pairs[:, 1]]
+    fourth = (tri2[:, :, None] != tri1[:, None, :]).all(axis=2).argmax(axis=1)
+    a, b, c = vertices[tri1[:, 0]], vertices[tri1[:, 1]], vertices[tri1[:, 2]]
+    d = vertices[tri2[np.arange(len(tri2)), fourth]]
+    det = np.einsum("ij,ij->i", b - a, np.cross(c - a, d - a))
+    return pairs[np.abs(det) < 0.0001]
+
+# Groups triangles into flat polygons, by merging any two coplanar triangles
+# that share an edge; returns a list of polygons, each a list of triangle
+# indices
+# Only triangles sharing an edge are compared, and polygons are joined with a
+# disjoint-set structure. Polygons keep their creation order, and triangles
+# within them are kept in the order they were merged, so the result (and thus
+# the UV map) is the same as with the original all-pairs comparison
+def merge_coplanar(vertices, indices, edges=None):
+    pairs = coplanar_pairs(vertices, indices, edges)
+    starts = np.searchsorted(pairs[:, 0], np.arange(len(indices) + 1)).tolist()
+    neighbors = pairs[:, 1].tolist()
+
+    tris_to_polys = [None for n in range(len(indices))]
+    poly_parents = []
+    poly_heads = []
+    poly_tails = []
+    next_tris = [None for n in range(len(indices))]
+
+    def find(p):
+        root = p
+        while poly_parents[root] != root:
+            root = poly_parents[root]
+        while poly_parents[p] != root:
+            poly_parents[p], p = root, poly_parents[p]
+        return root
+
+    for n1 in range(len(indices)):
+        if tris_to_polys[n1] is None:
+            tris_to_polys[n1] = len(poly_parents)
+            poly_parents.append(len(poly_parents))
+            poly_heads.append(n1)
+            poly_tails.append(n1)
+        p1 = find(tris_to_polys[n1])
+        for n2 in neighbors[starts[n1]:starts[n1 + 1]]:
+            if tris_to_polys[n2] is not None:
+                p2 = find(tris_to_polys[n2])
+                if p2 == p1:
+                    continue
+                poly_parents[p2] = p1
+                next_tris[poly_tails[p1]] = poly_heads[p2]
+                poly_tails[p1] = poly_tails[p2]
+                poly_heads[p2] = None
+            else:
+                tris_to_polys[n2] = p1
+                next_tris[poly_tails[p1]] = n2
+                poly_tails[p1] = n2
+
+    polys_to_tris = []
+    for head in poly_heads:
+        if head is not None:
+            polys_to_tris.append([])
+            t = head
+            while t is not None:
+                polys_to_tris[-1].append(t)
+                t = next_tris[t]
+    return polys_to_tris
+
+# Returns twice the signed area of the 2D triangle (o, a, b)
+def cross_2d(o, a, b):
+    return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+# Finds the boundary loops of a polygon, given its triangles, as lists of
+# vertex indices following their winding; the outer loop goes counterclockwise
+# and holes go clockwise. Returns None if the boundary touches itself
+def boundary_loops(tris):
+    edges = set()
+    for a, b, c in tris:
+        edges.update(((a, b), (b, c), (c, a)))
+    next_vertex = {}
+    for a, b in edges:
+        if (b, a) not in edges:
+            if a in next_vertex:
+                return None
+            next_vertex[a] = b
+    loops = []
+    while next_vertex:
+        start, v = next_vertex.popitem()
+        loop = [start]
+        while v != start:
+            loop.append(v)
+            v = next_vertex.pop(v, None)
+            if v is None:
+                return None
+        loops.append(loop)
+    return loops
+
+# Projects the vertices of a polygon onto the plane it's most aligned with,
+# such that its triangles go counterclockwise; returns a dictionary from vertex
+# indices to 2D points
+def project_polygon(vertices, tris):
+    corners = vertices[np.array(tris)]
+    normal = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]).sum(axis=0)
+    k = int(np.abs(normal).argmax())
+    axes = [(k + 1) % 3, (k + 2) % 3]
+    if normal[k] < 0:
+        axes.reverse()
+    used = sorted({v for tri in tris for v in tri})
+    return dict(zip(used, vertices[used][:, axes].tolist()))
+
+# Returns True if the boundary vertex at 'loop[i]' lies on a straight line
+# between its neighbors
+def is_collinear(loop, i, points):
+    a, b, c = points[loop[i - 1]], points[loop[i]], points[loop[(i + 1) % len(loop)]]
+    scale = abs(c[0] - a[0]) + abs(c[1] - a[1])
+    return abs(cross_2d(a, b, c)) <= 1e-9 * scale * scale \
+        and (b[0] - a[0]) * (c[0] - b[0]) + (b[1] - a[1]) * (c[1] - b[1]) > 0
+
+# Returns True if the segments (a, b) and (c, d) cross at a point inside both
+def segments_cross(a, b, c, d):
+    return cross_2d(a, b, c) * cross_2d(a, b, d) < 0 and cross_2d(c, d, a) * cross_2d(c, d, b) < 0
+
+# Returns True if the direction from 'b' to 'p' points inside the polygon at
+# corner 'b', where 'a' and 'c' are its previous and next points
+def in_cone(a, b, c, p):
+    if cross_2d(a, b, c) >= 0:
+        return cross_2d(b, p, a) > 0 and cross_2d(p, b, c) > 0
+    return not (cross_2d(b, p, c) >= 0 and cross_2d(p, b, a) >= 0)
+
+# Joins each hole to the outer loop through a pair of coincident edges, so the
+# polygon can be triangulated as a single loop; returns None if no bridge is
+# found for a hole
+def bridge_holes(outer, holes, points):
+    loop = list(outer)
+    holes = sorted(holes, key=lambda hole: -max(points[v][0] for v in hole))
+    for h, hole in enumerate(holes):
+        j = max(range(len(hole)), key=lambda j: points[hole[j]][0])
+        m = points[hole[j]]
+        edges = [(loop[i - 1], loop[i]) for i in range(len(loop))]
+        for other in holes[h:]:
+            edges += [(other[i - 1], other[i]) for i in range(len(other))]
+        best = None
+        for i in range(len(loop)):
+            p = points[loop[i]]
+            distance = (p[0] - m[0]) ** 2 + (p[1] - m[1]) ** 2
+            if best is not None and distance >= best[0]:
+                continue
+            if not in_cone(points[loop[i - 1]], p, points[loop[(i + 1) % len(loop)]], m):
+                continue
+            if not in_cone(points[hole[j - 1]], m, points[hole[(j + 1) % len(hole)]], p):
+                continue
+            if any(segments_cross(m, p, points[e1], points[e2]) for e1, e2 in edges):
+                continue
+            best = (distance, i)
+        if best is None:
+            return None
+        i = best[1]
+        loop = loop[:i + 1] + hole[j:] + hole[:j + 1] + loop[i:]
+    return loop
+
+# Triangulates a simple polygon, given as a counterclockwise loop of vertex
+# indices, by repeatedly cutting off ears; returns None if it gets stuck
+def ear_clip(loop, points):
+    loop = list(loop)
+    tris = []
+    i = 0
+    stuck = 0
+    while len(loop) > 3:
+        if stuck > len(loop):
+            return None
+        a, b, c = loop[i - 1], loop[i], loop[(i + 1) % len(loop)]
+        pa, pb, pc = points[a], points[b], points[c]
+        ear = cross_2d(pa, pb, pc) > 0
+        if ear:
+            for v in loop:
+                p = points[v]
+                if p == pa or p == pb or p == pc:
+                    continue
+                if cross_2d(pa, pb, p) >= 0 and cross_2d(pb, pc, p) >= 0 and cross_2d(pc, pa, p) >= 0:
+                    ear = False
+                    break
+        if ear:
+            tris.append((a, b, c))
+            del loop[i]
+            i = i % len(loop)
+            stuck = 0
+        else:
+            i = (i + 1) % len(loop)
+            stuck += 1
+    if cross_2d(*[points[v] for v in loop]) <= 0:
+        return None
+    tris.append(tuple(loop))
+    return tris
+
+# Triangulates a polygon from its boundary loops, leaving out the vertices in
+# 'dropped'; returns None if it fails or doesn't cover the same area
+def triangulate_polygon(loops, points, area, dropped):
+    loops = [[v for v in loop if v not in dropped] for loop in loops]
+    loops.sort(key=lambda loop: -sum(cross_2d((0, 0), points[loop[i - 1]], points[loop[i]]) \
+        for i in range(len(loop))))
+    loop = bridge_holes(loops[0], loops[1:], points)
+    if loop is None:
+        return None
+    tris = ear_clip(loop, points)
+    if tris is None:
+        return None
+    new_area = sum(cross_2d(*[points[v] for v in tri]) for tri in tris)
+    if abs(new_area - area) > 1e-9 * area:
+        return None
+    return tris
+
+# Replaces the triangles of each polygon with a minimal triangulation of its
+# boundary, dropping interior vertices and boundary vertices that lie on a
+# straight edge; returns the new vertices, indices and polygons
+# Vertices are only dropped if every polygon using them can do so, to avoid
+# leaving gaps between polygons; polygons that can't be re-triangulated keep
+# their original triangles
+def simplify_polygons(vertices, indices, polys_to_tris):
+    poly_tris = [list(map(tuple, indices[polygon].tolist())) for polygon in polys_to_tris]
+    users = {}
+    for tris in poly_tris:
+        for v in {v for tri in tris for v in tri}:
+            users[v] = users.get(v, 0) + 1
+
+    # Find which vertices each polygon could do without
+    candidates = []
+    for tris in poly_tris:
+        loops = boundary_loops(tris)
+        if loops is None:
+            candidates.append(None)
+            continue
+        points = project_polygon(vertices, tris)
+        boundary = {v for loop in loops for v in loop}
+        interior = set(points.keys()) - boundary
+        if any(users[v] > 1 for v in interior):
+            candidates.append(None)
+            continue
+        collinear = {loop[i] for loop in loops for i in range(len(loop)) if is_collinear(loop, i, points)}
+        area = sum(cross_2d(*[points[v] for v in tri]) for tri in tris)
+        candidates.append((loops, points, area, interior, collinear))
+
+    # Triangulate, keeping polygons that fail as they are, until all agree
+    results = None
+    while results is None:
+        droppable = {}
+        for candidate in candidates:
+            if candidate is not None:
+                for v in candidate[4]:
+                    droppable[v] = droppable.get(v, 0) + 1
+        dropped = {v for v, count in droppable.items() if count == users[v]}
+        results = []
+        for p, candidate in enumerate(candidates):
+            if candidate is None:
+                results.append(poly_tris[p])
+                continue
+            loops, points, area, interior, collinear = candidate
+            if len(interior) == 0 and len(collinear & dropped) == 0:
+                # Any triangulation would have as many triangles
+                results.append(poly_tris[p])
+                continue
+            tris = triangulate_polygon(loops, points, area, dropped)
+            if tris is None:
+                candidates[p] = None
+                results = None
+                break
+            results.append(tris)
+
+    new_indices = np.array([tri for tris in results for tri in tris], dtype=np.int64).reshape(-1, 3)
+    new_polys = []
+    for tris in results:
+        start = sum(len(polygon) for polygon in new_polys)
+        new_polys.append(list(range(start, start + len(tris))))
+    # Remove unused vertices, keeping the order of the rest
+    used = np.zeros(len(vertices), dtype=bool)
+    used[new_indices.reshape(-1)] = True
+    ranks = np.cumsum(used) - 1
+    return vertices[used], ranks[new_indices], new_polys
+
+# Returns all triangle indices in polygon order, and the offset in that array
+# where each polygon starts
+def polygon_order(polys_to_tris):
+    lengths = np.array([len(polygon) for polygon in polys_to_tris], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    order = np.fromiter((t for polygon in polys_to_tris for t in polygon), dtype=np.int64,
+        count=int(lengths.sum()))
+    return order, offsets
+
+# Computes the axis-aligned bounding box of each polygon
+def bounding_boxes(vertices, indices, polys_to_tris):
+    order, offsets = polygon_order(polys_to_tris)
+    corners = vertices[indices[order]].reshape(-1, 3)
+    poly_minima = np.minimum.reduceat(corners, 3 * offsets, axis=0)
+    poly_maxima = np.maximum.reduceat(corners, 3 * offsets, axis=0)
+    return list(map(tuple, poly_minima.tolist())), list(map(tuple, poly_maxima.tolist()))
+
+# Returns the size in pixels of the rectangle that each polygon takes in
+# texture space, 16 pixels per node
+def uv_sizes(poly_minima, poly_maxima):
+    sizes = []
+    for n in range(len(poly_minima)):
+        vector = tuple(map(lambda x: x[0] - x[1], zip(poly_maxima[n], poly_minima[n])))
+        excludedindex = vector.index(0)
+        indices = list({0, 1, 2} - {excludedindex})
+        sizes.append((round(16 * vector[indices[0]]), round(16 * vector[indices[1]])))
+    return sizes
+
+# Places each rectangle at the free position closest to the origin, trying
+# every integer position in a grid covering all rectangles placed so far
+def pack_grid(sizes):
+    maxcoords = (0, 0)
+    uvrectangles = []
+    for sides in sizes:
+        bestfit = None
+        for x in range(0, maxcoords[0] * 16 + 1, 1):
+            for y in range(0, maxcoords[1] * 16 + 1, 1):
+                if not bestfit or max(x, y) < max(*bestfit):
+                    fits = True
+                    for uvrect in uvrectangles:
+                        if uvrect[0][0] + uvrect[1][0] > x and uvrect[0][0] < x + sides[0] \
+                        and uvrect[0][1] + uvrect[1][1] > y and uvrect[0][1] < y + sides[1]:
+                            fits = False
+                            break
+                    if fits:
+                        maxcoords = tuple(map(lambda x: max(x[0], x[1]), \
+                            zip(maxcoords, (x + sides[0], y + sides[1])) \
+                        ))
+                        bestfit = (x, y)
+        uvrectangles.append((bestfit, sides))
+    return uvrectangles
+
+# Skylines with more segments than this are searched through a segment tree,
+# until they get shorter than half of it; shorter ones are faster to scan from
+# left to right
+skyline_tree_length = 512
+
+# The segment tree of a skyline is a list with a leaf for each pixel column of
+# the square, holding y * size + x if a segment starts in that column, where
+# size is the number of leaves, or 'no_segment' otherwise, after a node for
+# each pair of nodes below with the lowest of them
+no_segment = math.inf
+
+def skyline_tree(skyline, side):
+    size = 1 << max(side - 1, 0).bit_length()
+    tree = [no_segment for n in range(2 * size)]
+    for x, y, w in skyline:
+        tree[size + x] = y * size + x
+    for n in range(size - 1, 0, -1):
+        tree[n] = min(tree[2 * n], tree[2 * n + 1])
+    return tree
+
+# Sets the leaf of a column, and the nodes above it that change
+def tree_set(tree, x, value):
+    n = len(tree) // 2 + x
+    tree[n] = value
+    while n > 1:
+        left, right = tree[n & ~1], tree[n | 1]
+        n //= 2
+        lowest = left if left < right else right
+        if tree[n] == lowest:
+            break
+        tree[n] = lowest
+
+# Returns the lowest value in the tree for the columns from 'start' to 'end',
+# not included
+def tree_lowest(tree, start, end):
+    lowest = no_segment
+    first, last = len(tree) // 2 + start, len(tree) // 2 + end
+    while first < last:
+        if first & 1:
+            if tree[first] < lowest:
+                lowest = tree[first]
+            first += 1
+        if last & 1:
+            last -= 1
+            if tree[last] < lowest:
+                lowest = tree[last]
+        first //= 2
+        last //= 2
+    return lowest
+
+# Returns the height of the skyline from its segment 'i' to the pixel column
+# 'end', or any height above 'limit' if it's higher than that
+def skyline_height(skyline, i, end, limit):
+    y = skyline[i][1]
+    j = i + 1
+    while y <= limit and j < len(skyline) and skyline[j][0] < end:
+        y = max(y, skyline[j][1])
+        j += 1
+    return y
+
+# Finds where a rectangle goes on a skyline, trying the start of each segment
+# from left to right; returns its top, position and the index of the segment,
+# or None if it doesn't fit. Further right, it has to be lower than the best
+# position found to beat it
+def skyline_scan(skyline, w, h, side):
+    best = None
+    limit = side - h
+    for i in range(len(skyline)):
+        x, y, _ = skyline[i]
+        if x + w > side:
+            break
+        if y <= limit:
+            y = skyline_height(skyline, i, x + w, limit)
+            if y <= limit:
+                best = (y + h, x, i, y)
+                limit = y - 1
+    return best
+
+# Finds where a rectangle goes like 'skyline_scan', but using the segment tree:
+# a rectangle placed at the start of a segment can't be lower than the segment
+# itself, so segments far enough from the right edge are tried from the lowest,
+# until none left can beat the best position found. Each segment tried splits
+# the columns left to search in two ranges, as (lowest, start, end) tuples
+def skyline_search(skyline, tree, w, h, side):
+    size = len(tree) // 2
+    best = None
+    end = max(side - w + 1, 0)
+    ranges = [(tree_lowest(tree, 0, end), 0, end)]
+    while True:
+        k = ranges.index(min(ranges))
+        lowest, start, end = ranges[k]
+        if lowest == no_segment:
+            break
+        y, x = divmod(lowest, size)
+        # The highest it can go there to beat the best position found, or to
+        # be as high but further left
+        limit = side - h
+        if best is not None:
+            limit = min(limit, best[0] - h - (0 if x < best[1] else 1))
+        if y > limit:
+            break
+        ranges[k:k + 1] = [(tree_lowest(tree, start, x), start, x),
+            (tree_lowest(tree, x + 1, end), x + 1, end)]
+        i = bisect.bisect_left(skyline, (x,))
+        y = skyline_height(skyline, i, x + w, limit)
+        if y <= limit:
+            best = (y + h, x, i, y)
+    return best
+
+# Tries to place all rectangles, in the given order, inside a square of the
+# given side; returns their positions, or None if they don't fit
+# The free space is tracked as a skyline, a list of (x, y, width) segments
+# covering the whole width of the square; each rectangle goes where its top
+# edge would be lowest, and leftmost among those
+def skyline_fit(sizes, order, side):
+    skyline = [(0, 0, side)]
+    tree = None
+    positions = [None for n in range(len(sizes))]
+    for n in order:
+        w, h = sizes[n]
+        # A rectangle without width covers no column, so it goes at the origin
+        if w == 0:
+            if h > side:
+                return None
+            positions[n] = (0, 0)
+            continue
+        if tree is None and len(skyline) > skyline_tree_length:
+            tree = skyline_tree(skyline, side)
+        elif tree is not None and len(skyline) < skyline_tree_length // 2:
+            tree = None
+        if tree is None:
+            best = skyline_scan(skyline, w, h, side)
+        else:
+            best = skyline_search(skyline, tree, w, h, side)
+        if best is None:
+            return None
+        top, x, i, y = best
+        positions[n] = (x, y)
+        # Replace the segments under the new rectangle with its top edge
+        j = i
+        while j < len(skyline) and skyline[j][0] + skyline[j][2] <= x + w:
+            j += 1
+        # Segments that can change, up to the one after those replaced, which
+        # can be merged with the new ones
+        changed = skyline[max(i - 1, 0):min(j + 2, len(skyline))]
+        new_segments = [(x, top, w)]
+        if j < len(skyline) and skyline[j][0] < x + w:
+            sx, sy, sw = skyline[j]
+            new_segments.append((x + w, sy, sx + sw - x - w))
+            j += 1
+        skyline[i:j] = new_segments
+        # Merge neighboring segments at the same height
+        k = max(i - 1, 0)
+        while k < min(i + 2, len(skyline) - 1):
+            if skyline[k][1] == skyline[k + 1][1]:
+                skyline[k:k + 2] = [(skyline[k][0], skyline[k][1], skyline[k][2] + skyline[k + 1][2])]
+            else:
+                k += 1
+        # Update the tree with the segments that changed
+        if tree is not None:
+            end = changed[-1][0] + changed[-1][2]
+            old = {(sy, sx) for sx, sy, sw in changed}
+            new = set()
+            for sx, sy, sw in skyline[max(i - 1, 0):i + 3]:
+                if sx >= end:
+                    break
+                new.add((sy, sx))
+            for sy, sx in old - new:
+                tree_set(tree, sx, no_segment)
+            for sy, sx in new - old:
+                tree_set(tree, sx, sy * (len(tree) // 2) + sx)
+    return positions
+
+# Packs rectangles into the smallest power-of-two square that a skyline packer
+# can fit them in, trying them sorted by height and by area
+def pack_skyline(sizes):
+    orders = [
+        sorted(range(len(sizes)), key=lambda n: (-sizes[n][1], -sizes[n][0])),
+        sorted(range(len(sizes)), key=lambda n: (-sizes[n][0] * sizes[n][1], -sizes[n][1])),
+    ]
+    area = sum([w * h for w, h in sizes])
+    longest = max([max(w, h) for w, h in sizes])
+    side = 2 ** math.ceil(math.log2(max(longest, math.ceil(math.sqrt(area)), 1)))
+    while True:
+        best = None
+        for order in orders:
+            positions = skyline_fit(sizes, order, side)
+            if positions is not None:
+                height = max([y + h for (x, y), (w, h) in zip(positions, sizes)])
+                if best is None or height < best[0]:
+                    best = (height, positions)
+        if best is not None:
+            return list(zip(best[1], sizes))
+        side *= 2
+
+packers = {
+    "grid": pack_grid,
+    "skyline": pack_skyline,
+}
+
+# Places a rectangle for each polygon in texture space using one of 'packers';
+# returns the rectangles and the side of the resulting power-of-two texture
+def pack_uvs(poly_minima, poly_maxima, packer="grid"):
+    uvrectangles = packers[packer](uv_sizes(poly_minima, poly_maxima))
+    return uvrectangles, packed_side(uvrectangles)
+
+# Returns the side of the smallest power-of-two square holding all rectangles
+def packed_side(uvrectangles):
+    endcoords = list(map(lambda x: tuple(map(sum, zip(x[0], x[1]))), uvrectangles))
+    maxside = max([max(coord) for coord in endcoords])
+    return 2 ** math.ceil(math.log2(maxside))
+
+# Returns the fraction of the texture covered by polygons
+def fill_ratio(uvrectangles, maxside):
+    return sum([w * h for position, (w, h) in uvrectangles]) / maxside ** 2
+
+# Computes texture coordinates for every triangle corner; returns them, with
+# shape (T, 3, 2), along with the vertex indices of triangles in output order
+def map_uvs(vertices, indices, polys_to_tris, poly_minima, poly_maxima, uvrectangles, maxside):
+    order, offsets = polygon_order(polys_to_tris)
+    poly_minima = np.array(poly_minima)
+    size_3d = np.array(poly_maxima) - poly_minima
+    # Drop the axis along which each polygon is flat
+    kept_axes = np.argsort(size_3d == 0, axis=1, kind="stable")[:, :2]
+    kept_axes.sort(axis=1)
+    base_3d = np.take_along_axis(poly_minima, kept_axes, axis=1)
+    size_3d = np.take_along_axis(size_3d, kept_axes, axis=1)
+    base_uv = np.array([uvrect[0] for uvrect in uvrectangles], dtype=np.float64)
+    size_uv = np.array([uvrect[1] for uvrect in uvrectangles], dtype=np.float64)
+
+    polys = np.repeat(np.arange(len(polys_to_tris)), np.diff(np.append(offsets, len(order))))
+    tris = indices[order]
+    corners = np.take_along_axis(vertices[tris], kept_axes[polys][:, None, :], axis=2)
+    uvmap = ((corners - base_3d[polys][:, None, :]) * size_uv[polys][:, None, :] \
+        / size_3d[polys][:, None, :] + base_uv[polys][:, None, :]) / maxside
+    return uvmap, tris
+
+# Gives a texture coordinate index to every triangle corner, sharing it among
+# corners of the same polygon at the same vertex, which always have the same
+# UV; returns the distinct UVs, in order of first appearance, and the indices
+# with shape (T, 3)
+def index_uvs(polys_to_tris, uvmap, tris, vertex_count):
+    lengths = [len(polygon) for polygon in polys_to_tris]
+    polys = np.repeat(np.arange(len(polys_to_tris), dtype=np.int64), lengths)
+    keys = (polys[:, None] * vertex_count + tris).reshape(-1)
+    unique_keys, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    ranks = np.empty_like(order)
+    ranks[order] = np.arange(len(order))
+    uvs = uvmap.reshape(-1, 2)[first[order]]
+    return uvs, ranks[inverse.reshape(-1)].reshape(-1, 3)
+
+# Finds which cells of a grid of the given cell size lie inside a closed mesh,
+# by casting a ray along X through the center of every column of cells and
+# filling cells between pairs of crossings; returns a boolean array indexed
+# by X, Y and Z, and the position of the grid's corner
+def voxelize(vertices, indices, cell_size):
+    origin = np.floor(vertices.min(axis=0) / cell_size) * cell_size
+    shape = np.maximum(np.ceil((vertices.max(axis=0) - origin) / cell_size - 1e-9), 1) \
+        .astype(np.int64)
+    # Rays are nudged slightly so that they don't run exactly along edges
+    grid = (vertices - origin) / cell_size - 0.5 + np.array([0, 1e-6, 2e-6])
+    columns, crossings = [], []
+    for a, b, c in grid[indices].tolist():
+        area = (b[1] - a[1]) * (c[2] - a[2]) - (b[2] - a[2]) * (c[1] - a[1])
+        if area == 0:
+            continue
+        y0, y1 = math.ceil(min(a[1], b[1], c[1])), math.floor(max(a[1], b[1], c[1]))
+        z0, z1 = math.ceil(min(a[2], b[2], c[2])), math.floor(max(a[2], b[2], c[2]))
+        if y0 > y1 or z0 > z1:
+            continue
+        y, z = np.meshgrid(np.arange(y0, y1 + 1), np.arange(z0, z1 + 1), indexing="ij")
+        y, z = y.reshape(-1), z.reshape(-1)
+        # Barycentric coordinates of the column centers
+        u = ((b[1] - y) * (c[2] - z) - (b[2] - z) * (c[1] - y)) / area
+        v = ((c[1] - y) * (a[2] - z) - (c[2] - z) * (a[1] - y)) / area
+        w = 1 - u - v
+        inside = (u >= 0) & (v >= 0) & (w >= 0)
+        columns.append(y[inside] * shape[2] + z[inside])
+        crossings.append(u[inside] * a[0] + v[inside] * b[0] + w[inside] * c[0])
+
+    solid = np.zeros(shape, dtype=bool)
+    if len(columns) == 0:
+        return solid, origin
+    columns, crossings = np.concatenate(columns), np.concatenate(crossings)
+    order = np.lexsort((crossings, columns))
+    columns, crossings = columns[order], crossings[order]
+    # Pair up consecutive crossings in each column, entering and leaving the mesh
+    starts = np.flatnonzero(np.diff(columns, prepend=-1))
+    ranks = np.arange(len(columns)) - np.repeat(starts, np.diff(np.append(starts, len(columns))))
+    entering = np.flatnonzero((ranks % 2 == 0)[:-1] & (columns[1:] == columns[:-1]))
+    for n in entering.tolist():
+        x0 = max(math.ceil(crossings[n]), 0)
+        x1 = min(math.floor(crossings[n + 1]), shape[0] - 1)
+        column = int(columns[n])
+        solid[x0:x1 + 1, column // shape[2], column % shape[2]] = True
+    return solid, origin
+
+# Covers all cells in 'solid' with boxes made only of solid cells, picking at
+# each step the box that covers the most cells not covered yet; boxes are
+# returned as (x0, y0, z0, x1, y1, z1) cell ranges, with exclusive ends
+# Boxes are grown from the lowest corners of the uncovered cells, along the
+# three axes in every order
+def cover_cells(solid):
+    boxes = []
+    uncovered = solid.copy()
+    while uncovered.any():
+        lower = np.zeros_like(uncovered)
+        for axis in range(3):
+            lower |= np.roll(uncovered, 1, axis=axis) & \
+                (np.arange(solid.shape[axis]) > 0).reshape([-1 if a == axis else 1 for a in range(3)])
+        best, best_count = None, 0
+        for seed in np.argwhere(uncovered & ~lower).tolist():
+            for axes in ((0, 1, 2), (0, 2, 1), (1, 0, 2), (1, 2, 0), (2, 0, 1), (2, 1, 0)):
+                box = seed + [n + 1 for n in seed]
+                for axis in axes:
+                    while box[axis + 3] < solid.shape[axis]:
+                        slab = list(box)
+                        slab[axis], slab[axis + 3] = box[axis + 3], box[axis + 3] + 1
+                        if not solid[slab[0]:slab[3], slab[1]:slab[4], slab[2]:slab[5]].all():
+                            break
+                        box[axis + 3] += 1
+                count = uncovered[box[0]:box[3], box[1]:box[4], box[2]:box[5]].sum()
+                if count > best_count:
+                    best, best_count = tuple(box), count
+        uncovered[best[0]:best[3], best[1]:best[4], best[2]:best[5]] = False
+        boxes.append(best)
+    return boxes
+
+# Reduces a list of boxes to at most 'max_boxes', by repeatedly replacing the
+# two boxes whose bounding box adds the fewest empty cells with that bounding
+# box; boxes inside a new box are dropped. Boxes only ever grow, so all solid
+# cells stay covered
+def merge_boxes(boxes, solid, max_boxes):
+    empty = np.pad(np.cumsum(np.cumsum(np.cumsum(~solid, 0), 1), 2, dtype=np.int64), ((1, 0),) * 3)
+    def empty_cells(box):
+        x0, y0, z0, x1, y1, z1 = box
+        return empty[x1, y1, z1] - empty[x0, y1, z1] - empty[x1, y0, z1] - empty[x1, y1, z0] \
+            + empty[x0, y0, z1] + empty[x0, y1, z0] + empty[x1, y0, z0] - empty[x0, y0, z0]
+    def contains(outer, inner):
+        return all(outer[a] <= inner[a] and inner[a + 3] <= outer[a + 3] for a in range(3))
+
+    boxes = list(boxes)
+    while len(boxes) > max_boxes:
+        best, best_cost = None, None
+        for i in range(len(boxes)):
+            for j in range(i + 1, len(boxes)):
+                union = tuple(min(boxes[i][a], boxes[j][a]) for a in range(3)) + \
+                    tuple(max(boxes[i][a], boxes[j][a]) for a in range(3, 6))
+                cost = empty_cells(union) - empty_cells(boxes[i]) - empty_cells(boxes[j])
+                if best_cost is None or cost < best_cost:
+                    best, best_cost = union, cost
+        boxes = [box for box in boxes if not contains(best, box)] + [best]
+    return boxes
+
+# Approximates the volume of a closed mesh with at most 'max_boxes' axis-aligned
+# boxes, accurate to 'cell_size' when there are enough of them; returns the
+# boxes as (x0, y0, z0, x1, y1, z1) tuples in OBJ coordinates, and the volume
+# they cover outside the mesh
+def fit_boxes(vertices, indices, max_boxes=8, cell_size=1/16):
+    solid, origin = voxelize(vertices, indices, cell_size)
+    boxes = merge_boxes(cover_cells(solid), solid, max_boxes)
+    covered = np.zeros_like(solid)
+    for x0, y0, z0, x1, y1, z1 in boxes:
+        covered[x0:x1, y0:y1, z0:z1] = True
+    extra_volume = (covered & ~solid).sum() * cell_size ** 3
+    return [tuple((np.array(box) * cell_size + np.tile(origin, 2)).tolist()) for box in boxes], \
+        extra_volume
+
+# Formats a number with the fewest digits that read back as the same value,
+# dropping any '.0' suffix
+def format_float(x):
+    text = repr(x + 0.0) # Turns -0.0 into 0.0
+    if text.endswith(".0"):
+        return text[:-2]
+    return text
+
+# Writes an OBJ file, building all of its contents before a single write
+def write_obj(filename, vertices, uvs, tris, uv_tris):
+    lines = []
+    for x, y, z in vertices.tolist():
+        lines.append("v {} {} {}\n".format(format_float(x), format_float(y), format_float(z)))
+    for u, v in uvs.tolist():
+        lines.append("vt {} {}\n".format(format_float(u), format_float(v)))
+    corners = np.stack([tris + 1, uv_tris + 1], axis=2).reshape(-1, 6)
+    for corner in corners.tolist():
+        lines.append("f {}/{} {}/{} {}/{}\n".format(*corner))
+    with open(filename, "wt") as file:
+        file.write("".join(lines))
+
+# Returns the name of the file where the collision boxes of a model are written
+def boxes_filename(obj_filename):
+    return obj_filename[:-len(".obj")] + ".boxes.lua"
+
+# Writes collision boxes as a Lua file returning a list of boxes, which can be
+# used as the 'fixed' field of a 'collision_box' or 'selection_box'. The X axis
+# is mirrored, like Minetest does when loading OBJ files
+def write_boxes(filename, boxes, extra_volume):
+    lines = [
+        "-- Collision boxes for {}, generated by 'tools/models/convert.py'\n" \
+            .format(os.path.basename(filename)[:-len(".boxes.lua")] + ".obj"),
+        "-- Boxes: {}, volume outside the mesh: {:.4f} nodes^3\n".format(len(boxes), extra_volume),
+        "return {\n",
+    ]
+    for x0, y0, z0, x1, y1, z1 in boxes:
+        lines.append("    {{{}, {}, {}, {}, {}, {}}},\n".format(
+            *map(format_float, (-x1, y0, z0, -x0, y1, z1))))
+    lines.append("}\n")
+    with open(filename, "wt") as file:
+        file.write("".join(lines))
+
+# Reads the texture coordinates of an OBJ file, with shape (N, 2)
+def read_obj_uvs(filename):
+    with open(filename, "rt") as file:
+        uvs = [line.split()[1:3] for line in file if line.startswith("vt ")]
+    return np.array(uvs, dtype=np.float64).reshape(-1, 2)
+
+# Replaces the texture coordinates of an OBJ file, keeping everything else
+def write_obj_uvs(filename, uvs):
+    with open(filename, "rt") as file:
+        lines = file.readlines()
+    uv_lines = iter(uvs.tolist())
+    for n, line in enumerate(lines):
+        if line.startswith("vt "):
+            lines[n] = "vt {} {}\n".format(*map(format_float, next(uv_lines)))
+    with open(filename, "wt") as file:
+        file.write("".join(lines))
+
+# Packs the textures of several models into a single atlas, given as a list of
+# (OBJ file name, texture side, fill ratio) tuples. Only the part of each
+# texture that its UVs use takes space, and it's placed as a whole, so the
+# textures already drawn for each model can be copied into the atlas. The OBJ
+# files are rewritten to use the atlas, and a JSON manifest listing the region
+# of each model is written to 'manifest_filename'. Returns the side of the
+# atlas and the fraction of it that's used, or None if there are no models, in
+# which case no atlas is made
+def build_atlas(models, manifest_filename, packer="grid"):
+    if len(models) == 0:
+        return None
+    all_uvs = [read_obj_uvs(obj_filename) for obj_filename, side, fill in models]
+    sizes = [tuple(np.ceil(uvs.max(axis=0, initial=0) * side - 1e-6).astype(int).tolist())
+        for uvs, (obj_filename, side, fill) in zip(all_uvs, models)]
+    regions = packers[packer](sizes)
+    atlas_side = packed_side(regions)
+
+    manifest = {"size": atlas_side, "models": {}}
+    for uvs, (obj_filename, side, fill), ((x, y), (w, h)) in zip(all_uvs, models, regions):
+        write_obj_uvs(obj_filename, (uvs * side + (x, y)) / atlas_side)
+        # Image rows go from top to bottom, unlike the V coordinate
+        manifest["models"][os.path.basename(obj_filename)[:-len(".obj")]] = {
+            "x": x, "y": atlas_side - y - h, "width": w, "height": h, "source_size": side,
+        }
+    with open(manifest_filename, "wt") as file:
+        json.dump(manifest, file, indent=4)
+        file.write("\n")
+    return atlas_side, sum(fill * side ** 2 for obj_filename, side, fill in models) / atlas_side ** 2
+
+# Exports an OpenSCAD model to an STL file, preferably in binary format;
+# returns False if OpenSCAD fails or isn't installed
+def export_scad(scad_filename, stl_filename):
+    for options in (["--export-format", "binstl"], []):
+        try:
+            result = subprocess.run(
+                ["openscad", "-o", stl_filename, *options, scad_filename],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+        except FileNotFoundError:
+            return False
+        if result.returncode == 0:
+            return True
+    return False
+
+# Starts exporting an OpenSCAD model as a binary STL file to a pipe, from which
+# it can be read through the 'stdout' attribute of the returned process
+def export_scad_stream(scad_filename):
+    return subprocess.Popen(
+        ["openscad", "-o", "-", "--export-format", "binstl", scad_filename],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    )
+
+# Runs all conversion stages after vertex welding; returns the side of the
+# texture and the fraction of it that's used. If 'max_boxes' isn't 0, collision
+# boxes are also written next to the OBJ file
+def convert_mesh(vertices, indices, obj_filename, packer="grid", simplify=False, edges=None,
+        max_boxes=0, box_tolerance=1/16):
+    if max_boxes > 0:
+        write_boxes(boxes_filename(obj_filename),
+            *fit_boxes(vertices, indices, max_boxes, box_tolerance))
+    polys_to_tris = merge_coplanar(vertices, indices, edges)
+    if simplify:
+        vertices, indices, polys_to_tris = simplify_polygons(vertices, indices, polys_to_tris)
+    poly_minima, poly_maxima = bounding_boxes(vertices, indices, polys_to_tris)
+    uvrectangles, maxside = pack_uvs(poly_minima, poly_maxima, packer)
+    uvmap, tris = map_uvs(vertices, indices, polys_to_tris, poly_minima, poly_maxima, \
+        uvrectangles, maxside)
+    uvs, uv_tris = index_uvs(polys_to_tris, uvmap, tris, len(vertices))
+    write_obj(obj_filename, vertices, uvs, tris, uv_tris)
+    return maxside, fill_ratio(uvrectangles, maxside)
+
+# Converts an STL file to an OBJ file
+def convert(stl_filename, obj_filename, packer="grid", tolerance=1e-5, simplify=False,
+        max_boxes=0, box_tolerance=1/16):
+    vertices, indices = weld_vertices(read_stl(stl_filename), tolerance)
+    return convert_mesh(vertices, indices, obj_filename, packer, simplify, None,
+        max_boxes, box_tolerance)
+
+# Converts an STL file read from a binary stream to an OBJ file, welding
+# vertices as the data arrives; if 'copy' is given, the STL data is also
+# written to it
+def convert_stream(stream, obj_filename, packer="grid", tolerance=1e-5, simplify=False,
+        max_boxes=0, box_tolerance=1/16, copy=None):
+    vertices, indices, edges = weld_stream(iter_stl(stream, copy), tolerance)
+    return convert_mesh(vertices, indices, obj_filename, packer, simplify, edges,
+        max_boxes, box_tolerance)
+
+# Adds the command-line options that control conversion to an argument parser
+def add_arguments(parser):
+    parser.add_argument("--packer", choices=packers.keys(), default="grid",
+        help="UV packing algorithm: 'grid' tries every position (slow), 'skyline' "
+        "packs rectangles by decreasing height or area")
+    parser.add_argument("--tolerance", type=float, default=1e-5,
+        help="distance along each axis under which vertices are welded together")
+    parser.add_argument("--simplify", action="store_true",
+        help="re-triangulate flat polygons with as few triangles as possible")
+    parser.add_argument("--max-boxes", type=int, default=0,
+        help="also write up to this many collision boxes to a '.boxes.lua' file")
+    parser.add_argument("--box-tolerance", type=float, default=1/16,
+        help="size of the grid that collision boxes are fitted to, in nodes")
+    parser.add_argument("--atlas", metavar="MANIFEST",
+        help="pack the textures of all models into one atlas, and write the region "
+        "of each model to this JSON file")
+
+def texture_format(maxside, fill):
+    return "{0} x {0}, {1:.1f}% filled".format(maxside, 100 * fill)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert STL files to OBJ")
+    parser.add_argument("names", nargs="+", help="file names, without the '.stl' extension")
+    parser.add_argument("--stdin", action="store_true",
+        help="read the STL data from standard input instead of 'name.stl'")
+    add_arguments(parser)
+    args = parser.parse_args()
+    if args.stdin and len(args.names) > 1:
+        parser.error("only one file can be read from standard input")
+    textures = []
+    for name in args.names:
+        if args.stdin:
+            texture = convert_stream(sys.stdin.buffer, name + ".obj", args.packer,
+                args.tolerance, args.simplify, args.max_boxes, args.box_tolerance)
+        else:
+            texture = convert(name + ".stl", name + ".obj", args.packer,
+                args.tolerance, args.simplify, args.max_boxes, args.box_tolerance)
+        print((name + ": " if len(args.names) > 1 else "") + texture_format(*texture))
+        textures.append((name + ".obj", *texture))
+    if args.atlas is not None:
+        print("Atlas: " + texture_format(*build_atlas(textures, args.atlas, args.packer)))
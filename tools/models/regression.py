@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+
+# This is a Python script
+# It times every stage of 'convert.py' separately (parsing, vertex welding,
+# coplanar merging, bounding boxes, UV packing, UV mapping and OBJ writing) on
+# every model under 'mods/*/models/*.scad' and on synthetic meshes of rising
+# size, and records the wall time, peak memory and output quality of each run.
+
+# Results are printed as a table, and can be written to a JSON file with
+# '--output'. Given a '--baseline' file written by an earlier run, it compares
+# both runs and exits with an error if any stage got slower or used more memory
+# by more than '--threshold', or if the output got worse; write the baseline on
+# the same machine, e.g. 'python3 regression.py --output baseline.json'. Both
+# runs must use the same '--packer' and '--simplify'.
+
+# Like 'benchmark.py', it reads the '.obj' files generated from the '.scad'
+# files if OpenSCAD is not available. Timings are the best of '--repeat' runs,
+# and only count as slower if they differ by more than 5 ms and by more than
+# the spread between the fastest and slowest runs. Memory is measured on a
+# separate run, as tracing allocations slows Python code down.
+
+import argparse, glob, json, os, platform, sys, tempfile, time, tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import numpy as np
+import benchmark, convert
+
+# Differences in time below this many seconds, or below the spread between
+# the fastest and slowest of the repeated runs, are not considered regressions,
+# as they are mostly noise
+time_noise = 5e-3
+
+# Options that change which stages run or what they do, so runs made with
+# different values can't be compared
+compared_options = ["packer", "simplify"]
+
+def quad(a, b, c, d):
+    return [[a, b, c], [a, c, d]]
+
+# Generates the six faces of an axis-aligned box, facing outwards
+def box_faces(x0, y0, z0, x1, y1, z1):
+    return quad((x0, y0, z0), (x0, y1, z0), (x1, y1, z0), (x1, y0, z0)) \
+        + quad((x0, y0, z1), (x1, y0, z1), (x1, y1, z1), (x0, y1, z1)) \
+        + quad((x0, y0, z0), (x1, y0, z0), (x1, y0, z1), (x0, y0, z1)) \
+        + quad((x0, y1, z0), (x0, y1, z1), (x1, y1, z1), (x1, y1, z0)) \
+        + quad((x0, y0, z0), (x0, y0, z1), (x0, y1, z1), (x0, y1, z0)) \
+        + quad((x1, y0, z0), (x1, y1, z0), (x1, y1, z1), (x1, y0, z1))
+
+# Generates a grid of separate cubes, 12 triangles each
+def synthetic_boxes(triangles):
+    count = max(triangles // 12, 1)
+    side = int(np.ceil(np.sqrt(count)))
+    result = []
+    for n in range(count):
+        x, y = (n % side) * 3 / 16, (n // side) * 3 / 16
+        result += box_faces(x, y, 0, x + 2 / 16, y + 2 / 16, (n % 5 + 1) / 16)
+    return np.array(result, dtype=np.float64)
+
+# Generates a cylinder along Z approximated by axis-aligned slabs, like the
+# stepped round shapes of the OpenSCAD scripts in the game; resolution rises
+# with size like '$fn' does, with 24 triangles per pair of slabs. Slabs are
+# whole pixels wide, as closer vertices would be welded together
+def synthetic_cylinder(triangles):
+    steps = max(triangles // 24, 1)
+    result = []
+    for n in range(steps):
+        # Half-width of the slab at this height, so that slabs follow a circle
+        y0, y1 = n / 16, (n + 1) / 16
+        half = round(np.sqrt(max(steps ** 2 - n ** 2, 0))) / 16
+        for y, z in ((y0, y1), (-y1, -y0)):
+            result += box_faces(-half, y, 0, half, z, 1)
+    return np.array(result, dtype=np.float64)
+
+# Generates a closed staircase, 1 node wide, with steps 1/16 deep and high;
+# the sides are split in one column per step, about 10 triangles per step
+def synthetic_staircase(triangles):
+    steps = max(triangles // 10, 1)
+    h = 1 / 16
+    result = []
+    for n in range(steps):
+        x0, x1, top = n * h, (n + 1) * h, (n + 1) * h
+        # Tread, riser, bottom and both sides of this column
+        result += quad((x0, top, 0), (x0, top, 1), (x1, top, 1), (x1, top, 0))
+        result += quad((x0, n * h, 0), (x0, n * h, 1), (x0, top, 1), (x0, top, 0))
+        result += quad((x0, 0, 0), (x1, 0, 0), (x1, 0, 1), (x0, 0, 1))
+        result += quad((x0, 0, 0), (x0, top, 0), (x1, top, 0), (x1, 0, 0))
+        result += quad((x0, 0, 1), (x1, 0, 1), (x1, top, 1), (x0, top, 1))
+    end = steps * h
+    result += quad((end, 0, 0), (end, end, 0), (end, end, 1), (end, 0, 1))
+    return np.array(result, dtype=np.float64)
+
+synthetic_meshes = {
+    "boxes": synthetic_boxes,
+    "cylinder": synthetic_cylinder,
+    "staircase": synthetic_staircase,
+}
+
+def write_stl(filename, triangles):
+    records = np.zeros(len(triangles), dtype=convert.binary_record_dtype)
+    records["vertices"] = triangles
+    with open(filename, "wb") as file:
+        file.write(bytes(80) + len(triangles).to_bytes(4, "little") + records.tobytes())
+
+# Runs every stage of the conversion on an STL file, in order; returns the
+# time each stage took and the resulting quality metrics. If 'trace' is True,
+# returns the peak memory allocated by each stage instead of its time
+def run_stages(stl_filename, obj_filename, packer, simplify, trace=False):
+    results = {}
+    def stage(name, function, *args):
+        if trace:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        result = function(*args)
+        if trace:
+            results[name] = tracemalloc.get_traced_memory()[1] - base
+        else:
+            results[name] = time.perf_counter() - start
+        return result
+
+    triangles = stage("parse", convert.read_stl, stl_filename)
+    vertices, indices = stage("weld", convert.weld_vertices, triangles)
+    polys = stage("merge", convert.merge_coplanar, vertices, indices)
+    if simplify:
+        vertices, indices, polys = stage("simplify", convert.simplify_polygons,
+            vertices, indices, polys)
+    poly_minima, poly_maxima = stage("bounds", convert.bounding_boxes, vertices, indices, polys)
+    uvrectangles, maxside = stage("pack", convert.pack_uvs, poly_minima, poly_maxima, packer)
+    def map_and_index():
+        uvmap, tris = convert.map_uvs(vertices, indices, polys, poly_minima, poly_maxima,
+            uvrectangles, maxside)
+        return convert.index_uvs(polys, uvmap, tris, len(vertices)) + (tris,)
+    uvs, uv_tris, tris = stage("uvmap", map_and_index)
+    stage("write", convert.write_obj, obj_filename, vertices, uvs, tris, uv_tris)
+    quality = {
+        "triangles": len(triangles),
+        "output_triangles": len(indices),
+        "vertices": len(vertices),
+        "polygons": len(polys),
+        "texture": maxside,
+        "fill": convert.fill_ratio(uvrectangles, maxside),
+    }
+    return results, quality
+
+def run_mesh(stl_filename, obj_filename, args):
+    times, slowest = None, None
+    for n in range(args.repeat):
+        run_times, quality = run_stages(stl_filename, obj_filename, args.packer, args.simplify)
+        times = run_times if times is None else \
+            {name: min(times[name], run_times[name]) for name in times}
+        slowest = run_times if slowest is None else \
+            {name: max(slowest[name], run_times[name]) for name in slowest}
+    tracemalloc.start()
+    memory, quality = run_stages(stl_filename, obj_filename, args.packer, args.simplify, True)
+    tracemalloc.stop()
+    return {
+        "stages": {name: {"time": times[name], "spread": slowest[name] - times[name],
+            "memory": memory[name]} for name in times},
+        "quality": quality,
+    }
+
+# Compares two runs; returns a list of messages describing each regression,
+# and a list of the meshes and stages missing from the baseline, e.g. large
+# meshes that older versions of this script didn't pack
+def compare(results, baseline, threshold):
+    regressions, missing = [], []
+    for name, mesh in results["meshes"].items():
+        if name not in baseline["meshes"]:
+            missing.append(name)
+            continue
+        base = baseline["meshes"][name]
+        for stage, values in mesh["stages"].items():
+            if stage not in base["stages"]:
+                missing.append("{}: {}".format(name, stage))
+                continue
+            old_time, new_time = base["stages"][stage]["time"], values["time"]
+            noise = max(time_noise, base["stages"][stage].get("spread", 0) + values["spread"])
+            if new_time > old_time * (1 + threshold) and new_time - old_time > noise:
+                regressions.append("{}: {} took {} instead of {}".format(name, stage,
+                    benchmark.time_format(new_time), benchmark.time_format(old_time)))
+            old_memory, new_memory = base["stages"][stage]["memory"], values["memory"]
+            if new_memory > old_memory * (1 + threshold) and new_memory - old_memory > 1e+6:
+                regressions.append("{}: {} used {:.1f} MB instead of {:.1f} MB".format(name,
+                    stage, new_memory / 1e+6, old_memory / 1e+6))
+        old, new = base["quality"], mesh["quality"]
+        if new["output_triangles"] > old["output_triangles"]:
+            regressions.append("{}: {} output triangles instead of {}".format(name,
+                new["output_triangles"], old["output_triangles"]))
+        if old["texture"] is None:
+            continue
+        if new["texture"] > old["texture"] or new["texture"] == old["texture"] \
+        and new["fill"] < old["fill"] - 1e-9:
+            regressions.append("{}: texture is {} instead of {}".format(name,
+                convert.texture_format(new["texture"], new["fill"]),
+                convert.texture_format(old["texture"], old["fill"])))
+    return regressions, missing
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark model conversion stages for regressions")
+    parser.add_argument("--sizes", type=int, nargs="*", default=[1000, 10000, 50000, 200000],
+        help="triangle counts of the synthetic meshes")
+    parser.add_argument("--repeat", type=int, default=3,
+        help="number of timed runs on each mesh, of which the fastest is kept")
+    parser.add_argument("--packer", choices=convert.packers.keys(), default="skyline",
+        help="UV packing algorithm; 'grid' is very slow on large meshes")
+    parser.add_argument("--simplify", action="store_true",
+        help="also run the polygon re-triangulation stage")
+    parser.add_argument("--output", help="JSON file to write the results to")
+    parser.add_argument("--baseline", help="JSON file written by an earlier run to compare to")
+    parser.add_argument("--threshold", type=float, default=0.25,
+        help="fraction by which a stage can get slower or use more memory than in the baseline")
+    args = parser.parse_args()
+
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+    results = {
+        "options": {"packer": args.packer, "simplify": args.simplify, "repeat": args.repeat},
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "meshes": {},
+    }
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline, "rt") as file:
+            baseline = json.load(file)
+        different = ["{} is {} instead of {}".format(option, results["options"][option],
+            baseline["options"].get(option)) for option in compared_options
+            if results["options"][option] != baseline["options"].get(option)]
+        if len(different) > 0:
+            sys.exit("Can't compare to {}, which was run with other options: {}".format(
+                args.baseline, ", ".join(different)))
+
+    stage_names = None
+    with tempfile.TemporaryDirectory() as directory:
+        meshes = [(os.path.basename(filename), lambda filename=filename: benchmark.read_scad(filename))
+            for filename in sorted(glob.glob(os.path.join(root, "mods", "*", "models", "*.scad")))]
+        for kind, generator in synthetic_meshes.items():
+            for size in args.sizes:
+                meshes.append(("{} {}".format(kind, size), lambda g=generator, s=size: g(s)))
+
+        for name, load in meshes:
+            stl_filename = os.path.join(directory, "mesh.stl")
+            write_stl(stl_filename, load())
+            mesh = run_mesh(stl_filename, os.path.join(directory, "mesh.obj"), args)
+            results["meshes"][name] = mesh
+            if stage_names is None:
+                stage_names = list(mesh["stages"].keys())
+                print("NAME" + (28-4)*" " + "TRIANGLES" + (12-9)*" " + "".join(
+                    ["{:<12s}".format(stage.upper()) for stage in stage_names]) +\
+                    "PEAK MEMORY" + (16-11)*" " + "TEXTURE")
+            print("{:<28s}{:<12d}".format(name, mesh["quality"]["triangles"]) + "".join(
+                ["{:<12s}".format(benchmark.time_format(mesh["stages"][stage]["time"]))
+                for stage in stage_names]) + "{:<16s}{}".format("{:.1f} MB".format(
+                max(stage["memory"] for stage in mesh["stages"].values()) / 1e+6),
+                convert.texture_format(mesh["quality"]["texture"], mesh["quality"]["fill"])))
+
+    if args.output is not None:
+        with open(args.output, "wt") as file:
+            json.dump(results, file, indent=4)
+            file.write("\n")
+    if baseline is not None:
+        regressions, missing = compare(results, baseline, args.threshold)
+        print()
+        if len(missing) > 0:
+            print("Not compared, as they're missing from {}: {}".format(args.baseline,
+                ", ".join(missing)))
+        if len(regressions) > 0:
+            for regression in regressions:
+                print(regression)
+            print("{} regressions against {}".format(len(regressions), args.baseline))
+            sys.exit(1)
+        print("No regressions against {}".format(args.baseline))
+
+if __name__ == "__main__":
+    main()